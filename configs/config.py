@@ -1,5 +1,5 @@
 import os
-from typing import Literal
+from typing import ClassVar, Dict, Literal
 
 from configs.url_func import gen_mysql_db_url, gen_postgresql_db_url
 
@@ -15,6 +15,13 @@ class Config:
     LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
     UVICORN_LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "WARNING"
     DATABASE_URL: str = ""
+    DB_POOL_SIZE: int = 10  # 连接池常驻连接数
+    DB_MAX_OVERFLOW: int = 20  # 连接池允许的临时溢出连接数
+    DB_POOL_RECYCLE: int = 3600  # 连接回收时间 (秒)，需小于 MySQL wait_timeout
+    DB_POOL_TIMEOUT: int = 10  # 等待空闲连接的超时时间 (秒)
+    AUTO_MIGRATE: bool = True  # 启动时自动执行数据库迁移 (也可通过 `poetry run migrate upgrade` 手动执行)
+    DATABASE_ASYNC: bool = os.getenv("DATABASE_ASYNC", "").lower() == "true"
+    ASYNC_DATABASE_URL: str = ""  # 启用 DATABASE_ASYNC 时使用的异步驱动连接 URL
     JWT_SECRET_KEY: str = (
         os.getenv("JWT_SECRET_KEY") or f"secret:{os.urandom(32).hex()}"
     )
@@ -25,9 +32,48 @@ class Config:
         os.getenv("SUPER_ACCESS_KEY") or f"super-access-key:{os.urandom(32).hex()}"
     )
     RELOAD: bool = False
+    WORKERS: int = 1  # uvicorn worker 进程数 (启用 RELOAD 时无效)
     DEBUG: bool = True
     ACCESS_TOKEN_EXPIRE_DAYS: int = 7
     ACCESS_QPM_LIMIT: int = 100
+    GUARD_MAX_RECORDS: int = 100000  # 访问频率计数表的 IP 条目上限，超出时淘汰最久未访问的条目
+    GUARD_MAX_BANS: int = 10000  # 共享访问频率限制表中封禁记录的条目上限
+    # 访问频率限制的状态存储: memory (进程内) / shared (同一主机的多个 worker 通过 mmap 文件共享) / auto (多 worker 时使用 shared)
+    GUARD_BACKEND: Literal["auto", "memory", "shared"] = "auto"
+    # 各路由每个 IP 每分钟的请求开销预算 (开销按请求参数估算，普通请求为 1)，未列出的路由不做限制
+    ROUTE_COST_BUDGETS: ClassVar[Dict[str, int]] = {
+        "/preset/list": 600,
+        "/preset/details": 300,
+        "/preset/sync": 600,
+        "/preset/batch_create": 200,
+    }
+    GUARD_SHARED_PATH: str = ""  # 共享访问频率限制表的文件路径，默认为 /dev/shm (或临时目录) 下按端口区分的文件
+    FULLTEXT_NGRAM_SIZE: int = 2  # 需与 MySQL 的 ngram_token_size 保持一致
+    TOTAL_COUNT_CACHE_SIZE: int = 1024  # 检索结果总数缓存条目上限
+    TOTAL_COUNT_CACHE_TTL: int = 60  # 检索结果总数缓存有效期 (秒)
+    LIST_CACHE_SIZE: int = 256  # 检索接口响应缓存条目上限
+    LIST_CACHE_TTL: int = 10  # 检索接口响应缓存有效期 (秒)
+    DETAIL_CACHE_SIZE: int = 2048  # 预设详情缓存条目上限
+    DETAIL_CACHE_TTL: int = 300  # 预设详情缓存有效期 (秒)，使用次数在此期间内可能滞后
+    BATCH_DETAIL_MAX_IDS: int = 50  # 批量查询详情单次最多的 id 数
+    BATCH_CREATE_MAX_ITEMS: int = 100  # 批量创建单次最多的预设数
+    USED_COUNT_FLUSH_INTERVAL: float = 5  # 使用次数缓冲区最长写回间隔 (秒)
+    USED_COUNT_FLUSH_THRESHOLD: int = 1000  # 使用次数缓冲区累计增量达到该值时立即写回
+    EXPORT_BATCH_SIZE: int = 500  # 导出时每次从服务端游标读取的行数
+    IMPORT_BATCH_SIZE: int = 500  # 导入时每个事务写入的行数
+    IMPORT_MAX_LINE_SIZE: int = 64 * 1024  # 导入时单行数据的最大字节数
+    SYNC_MAX_LIMIT: int = 1000  # 增量同步单次返回的最大变更数
+    SYNC_SAFETY_LAG: float = 5  # 增量同步只返回该秒数之前的变更，避免遗漏尚未提交的事务
+    NEAR_DUPLICATE_DISTANCE: int = 3  # 预设信息 SimHash 指纹海明距离不超过该值时视为近似重复 (0-3)
+    NEAR_DUPLICATE_REJECT: bool = True  # 上传与已有预设近似重复的预设时拒绝 (超级访问密钥不受限)
+    TRENDING_HALF_LIFE: float = 24 * 3600  # 热度分数半衰期 (秒)
+    TRENDING_SNAPSHOT_INTERVAL: float = 60  # 热度排行快照生成间隔 (秒)
+    TRENDING_SIZE: int = 1000  # 热度排行保留的预设数
+    TRENDING_MIN_SCORE: float = 0.05  # 热度分数低于该值的预设不再统计
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # 响应体不小于该字节数时才压缩
+    GZIP_LEVEL: int = 6  # gzip 压缩级别 (1-9)
+    BROTLI_QUALITY: int = 5  # brotli 压缩质量 (0-11)，需安装 brotli
+    ZSTD_LEVEL: int = 3  # zstd 压缩级别 (1-22)，需安装 zstandard
 
 
 class DevConfig(Config):
@@ -42,6 +88,14 @@ class DevConfig(Config):
         password=os.getenv("MYSQL_PASSWORD", "123456"),
         database="ng_presethub",
     )
+    ASYNC_DATABASE_URL = gen_mysql_db_url(
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        port=int(os.getenv("MYSQL_PORT", 3306)),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", "123456"),
+        database="ng_presethub",
+        driver="aiomysql",
+    )
     RELOAD = True
     DEBUG = True
     SUPER_ACCESS_KEY = "presethub-super-access-key"
@@ -59,5 +113,15 @@ class ProdConfig(Config):
         password=os.getenv("MYSQL_PASSWORD", "123456"),
         database="ng_presethub",
     )
+    ASYNC_DATABASE_URL = gen_mysql_db_url(
+        host=os.getenv("MYSQL_HOST", "localhost"),
+        port=int(os.getenv("MYSQL_PORT", 3306)),
+        user=os.getenv("MYSQL_USER", "root"),
+        password=os.getenv("MYSQL_PASSWORD", "123456"),
+        database="ng_presethub",
+        driver="aiomysql",
+    )
     SUPER_ACCESS_KEY = os.getenv("SUPER_ACCESS_KEY")
     DEBUG = False
+    # 部分迁移 (如添加全文索引) 会重建数据表并阻塞写入，生产环境需在上线前执行 `poetry run migrate env=prod upgrade`
+    AUTO_MIGRATE = False
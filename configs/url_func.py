@@ -8,15 +8,16 @@ def gen_mysql_db_url(
     password: str = "",
     database: str = "",
     charset: str = "",
+    driver: str = "pymysql",
 ) -> str:
-    """生成 MySQL 数据库连接 URL"""
+    """生成 MySQL 数据库连接 URL (异步驱动使用 driver="aiomysql")"""
 
     user = quote_plus(user)
     password = quote_plus(password)
     database = quote_plus(database)
     charset = quote_plus(charset)
 
-    return f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}{charset and f'?charset={charset}'}"
+    return f"mysql+{driver}://{user}:{password}@{host}:{port}/{database}{charset and f'?charset={charset}'}"
 
 
 def gen_postgresql_db_url(
@@ -37,10 +38,10 @@ def gen_postgresql_db_url(
     return f"postgresql://{user}:{password}@{host}:{port}/{database}{sslmode and f'?sslmode={sslmode}'}"
 
 
-def gen_sqlite_db_url(db_path: str) -> str:
-    """生成 SQLite 数据库连接 URL"""
+def gen_sqlite_db_url(db_path: str, driver: str = "") -> str:
+    """生成 SQLite 数据库连接 URL (异步驱动使用 driver="aiosqlite")"""
 
     if not db_path.startswith("/") and not db_path.startswith("./"):
         db_path = f"./{db_path}"
 
-    return f"sqlite:///{db_path}"
+    return f"sqlite{driver and f'+{driver}'}:///{db_path}"
@@ -1,3 +1,5 @@
+import asyncio
+
 import uvicorn
 from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,16 +8,29 @@ from fastapi.security import OAuth2PasswordRequestForm
 from src.conf import APP_ENV, config
 from src.log import get_logging_config, logger
 from src.models import database_init
+from src.models.preset import (
+    DBPreset,
+    detail_cache,
+    list_response_cache,
+    near_duplicate_index,
+    total_count_cache,
+)
 
 # Custom routers import
+from src.routers.preset import custom_authorize
 from src.routers.preset import router as preset_router
 from src.routers.user import login
 from src.routers.user import router as user_router
 
 # $import_routers$ 路由导入锚 *请不要修改此行* (Anchor of the router import line *Do not modify this line*)
-from src.schemas.message import UserToken
+from src.schemas.message import Ret, UserToken
 from src.schemas.user import UserLogin
-from src.services.guard import check_ip_accessible
+from src.services.guard import access_guard, check_ip_accessible, get_client_ip
+from src.services.trending import trending_tracker
+from src.services.used_count import used_count_buffer
+from src.utils.compression import CompressionMiddleware
+from src.utils.db import UnitOfWork, get_db, get_pool_stats
+from src.utils.response import FastJSONResponse
 
 database_init()
 
@@ -24,8 +39,35 @@ app = FastAPI(
     description="FastAPI Quickstart",
     version="0.0.1",
     docs_url="/",
+    default_response_class=FastJSONResponse,
 )
 
+""" 应用生命周期事件 """
+
+
+def log_index_build_failure(future: "asyncio.Future[None]"):
+    """记录后台构建近似重复索引时的异常"""
+
+    if not future.cancelled() and future.exception() is not None:
+        logger.opt(exception=future.exception()).error("Failed to build near-duplicate index")
+
+
+@app.on_event("startup")
+async def startup():
+    used_count_buffer.start()
+    trending_tracker.start()
+    # 在后台线程中构建近似重复索引，不阻塞启动
+    future = asyncio.get_running_loop().run_in_executor(None, DBPreset.build_near_duplicate_index)
+    future.add_done_callback(log_index_build_failure)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await trending_tracker.stop()
+    # 写回缓冲区中尚未落库的预设使用次数
+    await used_count_buffer.stop()
+
+
 """ 跨域中间件配置 """
 app.add_middleware(
     CORSMiddleware,
@@ -35,20 +77,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+""" 响应压缩中间件配置 """
+app.add_middleware(CompressionMiddleware, minimum_size=config.COMPRESSION_MINIMUM_SIZE)
+
 """ 全局中间件配置 """
 
 
 @app.middleware("http")
 async def custom_middleware(request: Request, call_next):
     # 在每个请求处理之前的代码
-    ip = request.client.host  # type: ignore
-    ip = (
-        request.headers.get("X-Forwarded-For", "")
-        if not ip or ip == "127.0.0.1" or ip.startswith("192.168.")
-        else ip
-    )
-    if not check_ip_accessible(ip):
-        return {"code": "429", "message": "请求过于频繁或被禁止"}
+    if not check_ip_accessible(get_client_ip(request)):
+        return Ret.too_many_requests("请求过于频繁或被禁止")
 
     return await call_next(request)
 
@@ -64,10 +103,34 @@ async def root():
     return {"message": "Miraixy FastAPI Quickstart Running..."}
 
 
+@app.get("/stats")
+async def stats(request: Request):
+    """运行状态统计 (需要超级访问密钥)"""
+    if not custom_authorize(request):
+        return Ret.fail("预设中心访问权限受限")
+    return Ret.success(
+        "query success",
+        data={
+            "db_pool": get_pool_stats(),
+            "total_count_cache": total_count_cache.stats(),
+            "list_response_cache": list_response_cache.stats(),
+            "detail_cache": detail_cache.stats(),
+            "used_count_buffer": used_count_buffer.stats(),
+            "near_duplicate_index": near_duplicate_index.stats(),
+            "trending": trending_tracker.stats(),
+            "guard": access_guard.stats(),
+        },
+    )
+
+
 @app.post("/token", response_model=UserToken)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: UnitOfWork = Depends(get_db),
+):
     return await login(
         UserLogin(username=form_data.username, password=form_data.password),
+        db,
     )
 
 
@@ -79,5 +142,6 @@ def start():
         port=config.PORT,
         log_config=get_logging_config(),
         reload=config.RELOAD,
+        workers=config.WORKERS,
         log_level=config.UVICORN_LOG_LEVEL.lower(),
     )
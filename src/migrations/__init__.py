@@ -0,0 +1,109 @@
+import importlib
+import pkgutil
+from contextlib import contextmanager
+from datetime import datetime
+from types import ModuleType
+from typing import Dict, List, Set
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    select,
+    text,
+)
+
+from src.log import logger
+from src.migrations import versions
+
+MIGRATION_LOCK_NAME = "ng_presethub_migration"
+MIGRATION_LOCK_TIMEOUT = 600  # 等待其他进程完成迁移的最长时间 (秒)
+
+# 已执行的迁移版本记录表 (独立于模型的 Base，不随模型变化)
+metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(255), nullable=False),
+    Column("applied_time", DateTime, nullable=False),
+)
+
+
+def load_migrations() -> Dict[int, ModuleType]:
+    """按版本号加载 versions 目录下的迁移脚本 (文件名格式: v<版本号>_<说明>.py)"""
+
+    migrations: Dict[int, ModuleType] = {}
+    for info in pkgutil.iter_modules(versions.__path__):
+        if not info.name.startswith("v"):
+            continue
+        version = int(info.name[1:].split("_", 1)[0])
+        if version in migrations:
+            raise RuntimeError(f"Duplicate migration version: {version}")
+        migrations[version] = importlib.import_module(f"{versions.__name__}.{info.name}")
+    return dict(sorted(migrations.items()))
+
+
+def applied_versions(conn: Connection) -> Set[int]:
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+@contextmanager
+def migration_lock(conn: Connection, timeout: int = MIGRATION_LOCK_TIMEOUT):
+    """MySQL 下使用命名锁，避免多个工作进程同时执行迁移，返回是否取得锁"""
+
+    if conn.dialect.name != "mysql":
+        yield True
+        return
+
+    acquired = conn.execute(
+        text("SELECT GET_LOCK(:name, :timeout)"),
+        {"name": MIGRATION_LOCK_NAME, "timeout": timeout},
+    ).scalar()
+    if not acquired:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
+
+def run_migrations(engine: Engine, skip_if_locked: bool = False) -> List[int]:
+    """按版本顺序执行尚未执行的迁移脚本，返回本次执行的版本号
+
+    skip_if_locked 为 True 时 (应用启动)，其他进程正在迁移则直接跳过而不等待其完成；
+    否则最多等待 MIGRATION_LOCK_TIMEOUT 秒，超时抛出 RuntimeError
+    """
+
+    metadata.create_all(engine, checkfirst=True)
+    done: List[int] = []
+    timeout = 0 if skip_if_locked else MIGRATION_LOCK_TIMEOUT
+    with engine.connect() as conn, migration_lock(conn, timeout) as acquired:
+        if not acquired:
+            if not skip_if_locked:
+                raise RuntimeError("Timed out waiting for the database migration lock")
+            logger.warning("Another process is running database migrations, skipped")
+            return done
+        applied = applied_versions(conn)
+        conn.commit()
+        for version, module in load_migrations().items():
+            if version in applied:
+                continue
+            logger.warning(f"Applying migration {version}: {module.DESCRIPTION}")
+            module.upgrade(conn)
+            conn.execute(
+                schema_version.insert().values(
+                    version=version,
+                    description=module.DESCRIPTION,
+                    applied_time=datetime.now(),
+                ),
+            )
+            conn.commit()
+            done.append(version)
+    return done
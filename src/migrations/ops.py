@@ -0,0 +1,46 @@
+from typing import Optional, Sequence
+
+from sqlalchemy import Connection, inspect, text
+
+from src.log import logger
+
+
+def has_index(conn: Connection, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(conn).get_indexes(table))
+
+
+def add_index(
+    conn: Connection,
+    table: str,
+    name: str,
+    columns: Sequence[str],
+    fulltext: bool = False,
+    parser: Optional[str] = None,
+):
+    """在线添加索引 (已存在时跳过)
+
+    MySQL 下使用 InnoDB Online DDL (ALGORITHM=INPLACE)，普通索引构建期间不阻塞读写 (LOCK=NONE)，
+    全文索引仅允许并发读 (LOCK=SHARED)；全文索引仅在 MySQL 上创建
+    """
+
+    if has_index(conn, table, name):
+        return
+    dialect = conn.dialect.name
+    if fulltext and dialect != "mysql":
+        return
+
+    quote = conn.dialect.identifier_preparer.quote
+    column_list = ", ".join(quote(column) for column in columns)
+    logger.warning(f"Creating index {name} on table {table}...")
+    if dialect == "mysql":
+        kind = "FULLTEXT INDEX" if fulltext else "INDEX"
+        with_parser = f" WITH PARSER {parser}" if parser else ""
+        lock = "SHARED" if fulltext else "NONE"
+        conn.execute(
+            text(
+                f"ALTER TABLE {quote(table)} ADD {kind} {quote(name)} ({column_list}){with_parser}, "
+                f"ALGORITHM=INPLACE, LOCK={lock}",
+            ),
+        )
+    else:
+        conn.execute(text(f"CREATE INDEX {quote(name)} ON {quote(table)} ({column_list})"))
@@ -0,0 +1,16 @@
+from sqlalchemy import Connection
+
+from src.migrations.ops import add_index
+
+DESCRIPTION = "preset 表全文索引 (ngram 分词)"
+
+
+def upgrade(conn: Connection):
+    add_index(
+        conn,
+        "preset",
+        "ft_preset_text",
+        ["name", "description", "self_intro"],
+        fulltext=True,
+        parser="ngram",
+    )
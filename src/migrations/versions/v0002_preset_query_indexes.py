@@ -0,0 +1,14 @@
+from sqlalchemy import Connection
+
+from src.migrations.ops import add_index
+
+DESCRIPTION = "preset 表检索排序与结构化筛选索引"
+
+
+def upgrade(conn: Connection):
+    add_index(conn, "preset", "ix_preset_name", ["name"])
+    add_index(conn, "preset", "ix_preset_uploader_created_time", ["uploader", "created_time"])
+    add_index(conn, "preset", "ix_preset_preset_key", ["preset_key"])
+    add_index(conn, "preset", "ix_preset_used_count", ["used_count"])
+    add_index(conn, "preset", "ix_preset_created_time", ["created_time"])
+    add_index(conn, "preset", "ix_preset_last_update_time", ["last_update_time"])
@@ -5,10 +5,16 @@ from src.models.user import DBUser  # noqa: F401
 
 from src.models.preset import DBPreset  # noqa: F401
 # $table_create$ 自动创建表追加锚 *请不要修改此行* (Anchor of the table creation line *Do not modify this line*)
+from src.conf import config
+from src.migrations import run_migrations
 from src.utils.db import Base, engine
 
 
 def database_init():
     Base.metadata.create_all(engine, checkfirst=True)
+    # 对已存在的数据表执行版本化迁移 (create_all 不会修改已存在的表)；
+    # 其他 worker 正在迁移时跳过，不等待其完成
+    if config.AUTO_MIGRATE:
+        run_migrations(engine, skip_if_locked=True)
     # 创建对象的基类:
     logger.success("Database initialized.")
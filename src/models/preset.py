@@ -1,10 +1,106 @@
+from collections import defaultdict
 from datetime import datetime
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    and_,
+    func,
+    insert,
+    or_,
+    select,
+)
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
 
+from src.conf import config
 from src.log import logger
 from src.schemas.preset import QueryCondition
-from src.utils.db import Base, connect_db
+from src.services.trending import trending_tracker
+from src.utils.cache import TTLCache
+from src.utils.cursor import decode_cursor, encode_cursor
+from src.utils.db import (
+    Base,
+    run_after_commit,
+    session_scope,
+    supports_window_functions,
+)
+from src.utils.filters import compile_filters
+from src.utils.simhash import SimHashIndex
+
+# 允许用于排序 (及游标分页) 的字段
+SORTABLE_FIELDS = (
+    "id",
+    "name",
+    "preset_key",
+    "uploader",
+    "used_count",
+    "created_time",
+    "last_update_time",
+)
+
+# 允许结构化筛选的字段及其支持的操作 (组合需能被索引覆盖，见 compile_filters)
+FILTERABLE_FIELDS = {
+    "uploader": ("eq", "prefix", "in"),
+    "preset_key": ("eq", "prefix", "in"),
+    "used_count": ("eq", "in", "range"),
+    "created_time": ("eq", "range"),
+    "last_update_time": ("eq", "range"),
+}
+
+# 允许在检索结果中返回的字段 (默认全部返回)
+LIST_FIELDS = (
+    "id",
+    "name",
+    "preset_key",
+    "description",
+    "self_intro",
+    "uploader",
+    "used_count",
+    "created_time",
+    "last_update_time",
+)
+
+# 检索结果总数缓存 (按关键字与筛选条件区分)，预设变更后清空
+total_count_cache = TTLCache(
+    maxsize=config.TOTAL_COUNT_CACHE_SIZE,
+    ttl=config.TOTAL_COUNT_CACHE_TTL,
+)
+
+# 检索接口响应缓存 (按规范化后的检索条件区分，缓存编码后的 JSON 及其压缩版本)，预设变更后清空
+list_response_cache = TTLCache(
+    maxsize=config.LIST_CACHE_SIZE,
+    ttl=config.LIST_CACHE_TTL,
+)
+
+# 预设详情缓存 (按 id 缓存编码后的响应体、其压缩版本及 ETag)，预设更新或删除后移除
+detail_cache = TTLCache(
+    maxsize=config.DETAIL_CACHE_SIZE,
+    ttl=config.DETAIL_CACHE_TTL,
+)
+
+
+# 预设信息近似重复索引 (启动时构建，新增或删除预设后增量更新)
+near_duplicate_index = SimHashIndex(max_distance=config.NEAR_DUPLICATE_DISTANCE)
+
+
+def invalidate_list_caches():
+    total_count_cache.clear()
+    list_response_cache.clear()
+
+
+# 定义 Preset 删除记录模型 (增量同步使用)
+class DBPresetTombstone(Base):
+    __tablename__ = "preset_tombstone"
+
+    id = Column(String(64), primary_key=True, nullable=False, comment="已删除的 Preset Id")
+    deleted_time = Column(DateTime, nullable=False, index=True, comment="删除时间")
 
 
 # 定义 Preset 模型
@@ -29,98 +125,462 @@ class DBPreset(Base):
     last_update_time = Column(DateTime, default=datetime.now)
     created_time = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        # MySQL 全文索引 (ngram 分词器支持中日韩文本)，其余数据库回退为 LIKE 检索
+        Index(
+            "ft_preset_text",
+            "name",
+            "description",
+            "self_intro",
+            mysql_prefix="FULLTEXT",
+            mysql_with_parser="ngram",
+        ).ddl_if(dialect="mysql"),
+        # 检索排序与结构化筛选使用的索引
+        # (已存在的数据库通过 src/migrations/versions 中的迁移脚本添加，新增索引时需同步添加迁移)
+        Index("ix_preset_name", "name"),
+        Index("ix_preset_uploader_created_time", "uploader", "created_time"),
+        Index("ix_preset_preset_key", "preset_key"),
+        Index("ix_preset_used_count", "used_count"),
+        Index("ix_preset_created_time", "created_time"),
+        Index("ix_preset_last_update_time", "last_update_time"),
+    )
+
     @classmethod
-    def add(cls, data: "DBPreset"):
-        """新增 Preset 资源"""
+    def keyword_search(cls, db: Session, keyword: str):
+        """生成关键字检索条件，返回 (过滤条件, 相关度表达式)
 
-        with connect_db() as db:
-            try:
-                data.last_update_time = datetime.now()
-                data.created_time = datetime.now()
-                db.add(data)
-                db.commit()
-            except Exception as e:
-                db.rollback()
-                logger.exception(f"添加预设时出现错误: {e}")
-                return False
-            else:
-                return True
+        MySQL 下使用全文索引并按相关度排序；关键字短于 ngram 分词长度或其他数据库时
+        回退为名称、描述与预设信息上的 LIKE 检索，此时相关度表达式为 None
+        """
+
+        if db.get_bind().dialect.name == "mysql" and len(keyword) >= config.FULLTEXT_NGRAM_SIZE:
+            relevance = mysql.match(
+                cls.name,
+                cls.description,
+                cls.self_intro,
+                against=keyword,
+            ).in_natural_language_mode()
+            return relevance, relevance
+
+        return (
+            or_(
+                cls.name.contains(keyword, autoescape=True),
+                cls.description.contains(keyword, autoescape=True),
+                cls.self_intro.contains(keyword, autoescape=True),
+            ),
+            None,
+        )
+
+    @classmethod
+    def insert_ignore(cls, db: Session):
+        """生成 id 冲突时忽略该行的 INSERT 语句 (MySQL: INSERT IGNORE；SQLite / PostgreSQL: ON CONFLICT DO NOTHING)"""
+
+        # 使用 Core 表对象而非 ORM 批量插入，以便取得实际写入的行数
+        table = cls.__table__
+        dialect = db.get_bind().dialect.name
+        if dialect == "mysql":
+            return insert(table).prefix_with("IGNORE")
+        if dialect == "sqlite":
+            return sqlite.insert(table).on_conflict_do_nothing(index_elements=["id"])
+        if dialect == "postgresql":
+            return postgresql.insert(table).on_conflict_do_nothing(index_elements=["id"])
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+
+    @classmethod
+    def add(cls, data: "DBPreset", db: Optional[Session] = None) -> bool:
+        """新增 Preset 资源 (单条语句，id 已存在时不做修改)，返回是否为新增"""
+
+        now = datetime.now()
+        data.last_update_time = now
+        data.created_time = now
+        row = {
+            "id": data.id,
+            "name": data.name,
+            "preset_key": data.preset_key,
+            "description": data.description,
+            "self_intro": data.self_intro,
+            "uploader": data.uploader,
+            "used_count": data.used_count or 0,
+            "from_ip": data.from_ip,
+            "created_time": now,
+            "last_update_time": now,
+        }
+        return cls.add_many([row], db=db) == 1
+
+    @classmethod
+    def add_many(cls, items: Sequence[Dict[str, Any]], db: Optional[Session] = None) -> int:
+        """批量新增 Preset 资源 (各行字段需一致)，跳过已存在的 id，返回实际新增的数量
+
+        通过一条忽略主键冲突的 INSERT 完成，不再先查询已存在的 id，并发上传同一预设时不会报错。
+        last_update_time 同时是增量同步的变更时间，新增的行一律取当前时间 (忽略传入的值)，
+        否则水位线已越过该时间的同步客户端将永远收不到这些行
+        """
+
+        now = datetime.now()
+        rows = [{**item, "last_update_time": now} for item in items]
+        with session_scope(db) as db:
+            # 多行 INSERT，由数据库驱动合并为一条批量写入语句
+            inserted = db.execute(cls.insert_ignore(db), rows).rowcount
+            if inserted:
+                # 重新上传已删除的预设时移除其删除记录: 有删除记录的 id 不存在对应的行，必定在本次写入，
+                # 且新行的变更时间晚于删除时间，同步客户端会在删除记录之后收到新行
+                db.query(DBPresetTombstone).filter(
+                    DBPresetTombstone.id.in_([item["id"] for item in items]),
+                ).delete(synchronize_session=False)
+                run_after_commit(db, invalidate_list_caches)
+                # 已存在的预设内容与 id 一一对应，重复加入索引不影响结果
+                run_after_commit(
+                    db,
+                    partial(
+                        near_duplicate_index.add_many,
+                        [(item["id"], item["self_intro"]) for item in items],
+                    ),
+                )
+            return inserted
+
+    @classmethod
+    def iter_all(
+        cls,
+        batch_size: int,
+        fields: Sequence[str] = LIST_FIELDS,
+        db: Optional[Session] = None,
+    ) -> Iterator[Row]:
+        """按 id 顺序遍历全部 Preset 资源 (服务端游标，每次读取 batch_size 行，内存占用恒定)"""
+
+        with session_scope(db) as db:
+            yield from db.execute(
+                select(*cls.select_columns(fields))
+                .order_by(cls.id)
+                .execution_options(yield_per=batch_size),
+            )
+
+    @classmethod
+    def build_near_duplicate_index(cls):
+        """从数据库构建预设信息近似重复索引"""
+
+        rows = cls.iter_all(config.EXPORT_BATCH_SIZE, fields=("id", "self_intro"))
+        near_duplicate_index.build((row.id, row.self_intro) for row in rows)
+        logger.info(f"Near-duplicate index built: {len(near_duplicate_index)} presets")
 
     @classmethod
-    def get_by_id(cls, _id: int):
+    def get_many(
+        cls,
+        ids: Sequence[str],
+        fields: Sequence[str] = LIST_FIELDS,
+        db: Optional[Session] = None,
+    ) -> List[Row]:
+        """根据 id 批量查询 Preset 资源 (不保证顺序，不存在的 id 将被忽略)"""
+
+        with session_scope(db) as db:
+            return db.execute(
+                select(*cls.select_columns(fields)).where(cls.id.in_(ids)),
+            ).all()
+
+    @classmethod
+    def get_by_id(cls, _id: str, db: Optional[Session] = None):
         """根据 id 查询 Preset 资源"""
 
-        with connect_db() as db:
+        with session_scope(db) as db:
             return db.query(cls).filter(cls.id == _id).first()
 
     @classmethod
-    def query(cls, condition: QueryCondition):
-        """根据条件查询 Preset 资源"""
+    def select_columns(cls, fields: Sequence[str], preview_length: Optional[int] = None):
+        """生成查询列，preview_length 不为空时在数据库端截断 self_intro"""
 
-        with connect_db() as db:
+        columns = []
+        for name in fields:
+            if name not in LIST_FIELDS:
+                raise ValueError(f"Unsupported field: {name}")
+            column = getattr(cls, name)
+            if name == "self_intro" and preview_length:
+                column = func.substr(column, 1, preview_length).label(name)
+            columns.append(column)
+        return columns
+
+    @classmethod
+    def query(
+        cls,
+        condition: QueryCondition,
+        db: Optional[Session] = None,
+        fields: Optional[Sequence[str]] = None,
+        preview_length: Optional[int] = None,
+    ) -> Tuple[List[Row], int, Optional[str]]:
+        """根据条件查询 Preset 资源，返回 (结果列表, 总数, 下一页游标)
+
+        仅查询 fields 指定的列 (默认全部)，结果为可按字段名访问的行对象而非完整的 ORM 对象。
+        condition.cursor 为 None 时使用页码分页；否则使用游标分页 (首页传入空字符串)，
+        按 (排序字段, id) 定位到上一页末尾之后，深分页不再随页码线性变慢。
+        总数优先取自缓存，未命中时单独统计 (关键字检索时通过窗口函数与当前页一并查出)；
+        with_total 为 False 时不计算总数
+        """
+
+        with session_scope(db) as db:
             page = condition.page if condition.page else 1
             page_size = condition.page_size if condition.page_size else 10
             order_field_name = condition.order_by.field_name
             order_desc = condition.order_by.desc
             keyword = condition.keyword
 
-            query = db.query(cls)
+            if order_field_name not in ("", "relevance", "trending", *SORTABLE_FIELDS):
+                raise ValueError(f"Unsupported order field: {order_field_name}")
+
+            # 游标分页需要 id 与排序字段的值
+            fields = list(fields or LIST_FIELDS)
+            for name in ("id", "used_count", order_field_name):
+                if name in SORTABLE_FIELDS and name not in fields:
+                    fields.append(name)
+            query = db.query(*cls.select_columns(fields, preview_length))
 
-            # for _filter in condition.filters:
-            #     field_name = _filter.field_name
-            #     value = _filter.value
+            if order_field_name == "trending":
+                return cls._query_trending(query, condition, page, page_size)
 
-            #     # TODO 待实现: 检查参数类型，根据不同类型添加不同筛选条件
+            for criterion in compile_filters(cls, condition.filters, FILTERABLE_FIELDS):
+                query = query.filter(criterion)
 
+            relevance = None
             if keyword:
-                query = db.query(cls).filter(cls.name.like(f"%{keyword}%"))
+                criterion, relevance = cls.keyword_search(db, keyword)
+                query = query.filter(criterion)
+
+            count_key = condition.model_dump_json(include={"keyword", "filters"})
+            total = total_count_cache.get(count_key) if condition.with_total else None
+            # 统计期间有写入提交 (缓存被清空) 时不缓存本次统计的总数
+            generation = total_count_cache.generation
+
+            if condition.cursor is not None:
+                if condition.with_total and total is None:
+                    total = query.order_by(None).count()
+                    total_count_cache.set(count_key, total, generation=generation)
+                return cls._query_by_cursor(query, condition, page_size, total)
 
-            if order_field_name:
+            if order_field_name and order_field_name != "relevance":
                 query = query.order_by(
                     getattr(cls, order_field_name).asc()
                     if not order_desc
                     else getattr(cls, order_field_name).desc(),
                 )
+            elif keyword:
+                # 关键字检索默认按相关度排序，使用次数作为次要排序
+                if relevance is not None:
+                    query = query.order_by(relevance.desc())
+                query = query.order_by(cls.used_count.desc())
 
-            total = query.count()
-
+            paged = query
             if page and page_size:
-                query = query.offset((page - 1) * page_size)
-            query = query.limit(page_size)
+                paged = paged.offset((page - 1) * page_size)
+            paged = paged.limit(page_size)
+
+            if not condition.with_total or total is not None:
+                return paged.all(), total, None
+
+            if keyword and supports_window_functions(db):
+                # 关键字检索本就需要计算全部匹配行的相关度，在取出当前页的同一条语句中通过窗口函数计算总数
+                items = paged.add_columns(func.count().over().label("total_count")).all()
+                total = items[0].total_count if items else None
+                if total is None:
+                    total = query.order_by(None).count() if page > 1 else 0
+            else:
+                # 窗口函数会使按索引排序 + LIMIT 的查询需要遍历全部结果，此时单独统计总数
+                items = paged.all()
+                total = query.order_by(None).count()
+
+            total_count_cache.set(count_key, total, generation=generation)
+            return items, total, None
 
-            return query, total
+    @classmethod
+    def _query_trending(cls, query, condition: QueryCondition, page: int, page_size: int):
+        """按热度排行快照分页: 只查询当前页的预设 (已删除的预设将被跳过)，总数为排行长度"""
+
+        if condition.keyword or condition.filters:
+            raise ValueError("Trending ordering does not support keyword or filters")
+
+        ranking = trending_tracker.ranking
+        offset = (page - 1) * page_size
+        if condition.cursor:
+            field_name, offset = decode_cursor(condition.cursor, str, int)
+            if field_name != "trending" or offset < 0:
+                raise ValueError("Cursor does not match the requested ordering")
+        elif condition.cursor is not None:
+            offset = 0
+
+        ids = ranking[offset : offset + page_size]
+        rows = {row.id: row for row in query.filter(cls.id.in_(ids))} if ids else {}
+        items = [rows[_id] for _id in ids if _id in rows]
+        next_cursor = None
+        if condition.cursor is not None and offset + page_size < len(ranking):
+            next_cursor = encode_cursor("trending", offset + page_size)
+        return items, len(ranking), next_cursor
 
     @classmethod
-    def update(cls, data: "DBPreset", **kwargs):
+    def _query_by_cursor(
+        cls,
+        query,
+        condition: QueryCondition,
+        page_size: int,
+        total: Optional[int],
+    ):
+        """游标分页: WHERE (sort_col, id) > (上一页末尾) ORDER BY sort_col, id"""
+
+        order_field_name = condition.order_by.field_name
+        order_desc = condition.order_by.desc
+        if order_field_name == "relevance":
+            raise ValueError("Cursor pagination does not support relevance ordering")
+        if not order_field_name:
+            # 未指定排序字段时按使用次数倒序 (与数据库是否支持相关度排序无关)
+            order_field_name, order_desc = "used_count", True
+
+        column = getattr(cls, order_field_name)
+
+        if condition.cursor:
+            field_name, desc, value, last_id = decode_cursor(
+                condition.cursor,
+                str,
+                bool,
+                column.type.python_type,
+                str,
+            )
+            if field_name != order_field_name or desc != order_desc:
+                raise ValueError("Cursor does not match the requested ordering")
+            if order_desc:
+                query = query.filter(
+                    or_(column < value, and_(column == value, cls.id < last_id)),
+                )
+            else:
+                query = query.filter(
+                    or_(column > value, and_(column == value, cls.id > last_id)),
+                )
+
+        if order_desc:
+            query = query.order_by(column.desc(), cls.id.desc())
+        else:
+            query = query.order_by(column.asc(), cls.id.asc())
+
+        # 多取一条用于判断是否还有下一页
+        items = query.limit(page_size + 1).all()
+        next_cursor = None
+        if len(items) > page_size:
+            items = items[:page_size]
+            last = items[-1]
+            next_cursor = encode_cursor(
+                order_field_name,
+                order_desc,
+                getattr(last, order_field_name),
+                last.id,
+            )
+        return items, total, next_cursor
+
+    @classmethod
+    def changes_since(
+        cls,
+        watermark: Optional[Tuple[datetime, str]],
+        until: datetime,
+        limit: int,
+        db: Optional[Session] = None,
+    ) -> Tuple[List[Row], List[str], Optional[Tuple[datetime, str]], bool]:
+        """查询水位线之后新增或修改的 Preset 及删除记录
+
+        按 (修改/删除时间, id) 合并排序后取前 limit 条，仅包含 until 之前的变更；
+        返回 (变更的预设, 删除的 id, 新的水位线, 是否还有更多变更)，无变更时水位线不变
+        """
+
+        def after(time_column, id_column):
+            criteria = [time_column <= until]
+            if watermark is not None:
+                time, _id = watermark
+                criteria.append(
+                    or_(time_column > time, and_(time_column == time, id_column > _id)),
+                )
+            return and_(*criteria)
+
+        with session_scope(db) as db:
+            presets = db.execute(
+                select(*cls.select_columns(LIST_FIELDS))
+                .where(after(cls.last_update_time, cls.id))
+                .order_by(cls.last_update_time, cls.id)
+                .limit(limit + 1),
+            ).all()
+            tombstones = db.execute(
+                select(DBPresetTombstone.id, DBPresetTombstone.deleted_time)
+                .where(after(DBPresetTombstone.deleted_time, DBPresetTombstone.id))
+                .order_by(DBPresetTombstone.deleted_time, DBPresetTombstone.id)
+                .limit(limit + 1),
+            ).all()
+
+        changes = sorted(
+            [((row.last_update_time, row.id), row, False) for row in presets]
+            + [((row.deleted_time, row.id), row, True) for row in tombstones],
+            key=lambda change: change[0],
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        next_watermark = changes[-1][0] if changes else watermark
+        return (
+            [row for _, row, deleted in changes if not deleted],
+            [row.id for _, row, deleted in changes if deleted],
+            next_watermark,
+            has_more,
+        )
+
+    @classmethod
+    def update(cls, data: "DBPreset", db: Optional[Session] = None, **kwargs):
         """更新 Preset 资源"""
 
-        with connect_db() as db:
-            try:
+        try:
+            with session_scope(db) as db:
                 if "id" in kwargs:
                     del kwargs["id"]
                 if "created_time" in kwargs:
                     del kwargs["created_time"]
                 if "last_update_time" in kwargs:
                     del kwargs["last_update_time"]
-                data.last_update_time = datetime.now()
+                # 修改时间随 UPDATE 一并写入 (增量同步依赖该字段)
+                kwargs["last_update_time"] = datetime.now()
+                data.last_update_time = kwargs["last_update_time"]
                 db.query(cls).filter(cls.id == data.id).update(dict(**kwargs))
-                db.commit()
-            except Exception as e:
-                db.rollback()
-                logger.exception(f"编辑预设时出现错误: {e}")
-            else:
-                return True
+                run_after_commit(db, invalidate_list_caches)
+                run_after_commit(db, partial(detail_cache.pop, data.id))
+                if "self_intro" in kwargs:
+                    run_after_commit(
+                        db,
+                        partial(near_duplicate_index.add, data.id, kwargs["self_intro"]),
+                    )
+        except Exception as e:
+            logger.exception(f"编辑预设时出现错误: {e}")
+        else:
+            return True
 
     @classmethod
-    def delete(cls, data: "DBPreset"):
+    def increase_used_counts(cls, counts: Dict[str, int], db: Optional[Session] = None):
+        """批量原子地增加 Preset 使用次数 ({id: 增量})
+
+        不视为内容变更，不更新修改时间也不清理缓存；增量相同的预设合并为一条 UPDATE
+        """
+
+        by_increment: Dict[int, List[str]] = defaultdict(list)
+        for _id, increment in counts.items():
+            by_increment[increment].append(_id)
+
+        with session_scope(db) as db:
+            for increment, ids in sorted(by_increment.items()):
+                db.query(cls).filter(cls.id.in_(ids)).update(
+                    {cls.used_count: func.coalesce(cls.used_count, 0) + increment},
+                    synchronize_session=False,
+                )
+
+    @classmethod
+    def delete(cls, data: "DBPreset", db: Optional[Session] = None):
         """删除 Preset 资源"""
 
-        with connect_db() as db:
-            try:
-                db.query(cls).filter(cls.id == data.id).delete()
-                db.commit()
-            except:
-                db.rollback()
-                return False
-            else:
-                return True
+        try:
+            with session_scope(db) as db:
+                if db.query(cls).filter(cls.id == data.id).delete():
+                    # 记录删除以便增量同步的客户端得知
+                    db.merge(DBPresetTombstone(id=data.id, deleted_time=datetime.now()))
+                run_after_commit(db, invalidate_list_caches)
+                run_after_commit(db, partial(detail_cache.pop, data.id))
+                run_after_commit(db, partial(near_duplicate_index.remove, data.id))
+                run_after_commit(db, partial(trending_tracker.discard, data.id))
+        except:
+            return False
+        else:
+            return True
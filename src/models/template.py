@@ -1,9 +1,11 @@
 from datetime import datetime
+from typing import Optional
 
 from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.orm import Session
 
 from src.schemas.template import QueryCondition
-from src.utils.db import Base, db
+from src.utils.db import Base, db_registry
 
 
 # 定义 _TableName_ 模型
@@ -19,24 +21,27 @@ class DB_TableName_(Base):
     created_time = Column(DateTime, default=datetime.now)
 
     @classmethod
-    def add(cls, data: "DB_TableName_"):
+    def add(cls, data: "DB_TableName_", db: Optional[Session] = None):
         """新增 _TableName_ 资源"""
 
+        db = db if db is not None else db_registry()
         data.last_update_time = datetime.now()
         data.created_time = datetime.now()
         db.add(data)
         db.commit()
 
     @classmethod
-    def get_by_id(cls, _id: int):
+    def get_by_id(cls, _id: int, db: Optional[Session] = None):
         """根据 id 查询 _TableName_ 资源"""
 
+        db = db if db is not None else db_registry()
         return db.query(cls).filter(cls.id == _id).first()
 
     @classmethod
-    def query(cls, condition: QueryCondition):
+    def query(cls, condition: QueryCondition, db: Optional[Session] = None):
         """根据条件查询 _TableName_ 资源"""
 
+        db = db if db is not None else db_registry()
         page = condition.page if condition.page else 1
         page_size = condition.page_size if condition.page_size else 10
         order_field_name = condition.order_by.field_name
@@ -67,12 +72,13 @@ class DB_TableName_(Base):
             query = query.offset((page - 1) * page_size)
         query = query.limit(page_size)
 
-        return query, total
+        return query.all(), total
 
     @classmethod
-    def update(cls, data: "DB_TableName_", **kwargs):
+    def update(cls, data: "DB_TableName_", db: Optional[Session] = None, **kwargs):
         """更新 _TableName_ 资源"""
 
+        db = db if db is not None else db_registry()
         if "id" in kwargs:
             del kwargs["id"]
         if "created_time" in kwargs:
@@ -84,8 +90,9 @@ class DB_TableName_(Base):
         db.commit()
 
     @classmethod
-    def delete(cls, data: "DB_TableName_"):
+    def delete(cls, data: "DB_TableName_", db: Optional[Session] = None):
         """删除 _TableName_ 资源"""
 
+        db = db if db is not None else db_registry()
         db.query(cls).filter(cls.id == data.id).delete()
         db.commit()
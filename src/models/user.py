@@ -1,6 +1,9 @@
+from typing import Optional
+
 from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.orm import Session
 
-from src.utils.db import Base, db
+from src.utils.db import Base, db_registry
 
 
 # 定义User模型
@@ -16,20 +19,24 @@ class DBUser(Base):
     login_time = Column(DateTime)
 
     @classmethod
-    def add(cls, data: "DBUser"):
+    def add(cls, data: "DBUser", db: Optional[Session] = None):
+        db = db if db is not None else db_registry()
         db.add(data)
         db.commit()
 
     @classmethod
-    def get_by_username(cls, username: str):
+    def get_by_username(cls, username: str, db: Optional[Session] = None):
+        db = db if db is not None else db_registry()
         return db.query(cls).filter(cls.username == username).first()
 
     @classmethod
-    def update(cls, data: "DBUser", **kwargs):
+    def update(cls, data: "DBUser", db: Optional[Session] = None, **kwargs):
+        db = db if db is not None else db_registry()
         db.query(cls).filter(cls.username == data.username).update(dict(**kwargs))
         db.commit()
 
     @classmethod
-    def delete(cls, data: "DBUser"):
+    def delete(cls, data: "DBUser", db: Optional[Session] = None):
+        db = db if db is not None else db_registry()
         db.query(cls).filter(cls.username == data.username).delete()
         db.commit()
@@ -1,23 +1,51 @@
-from typing import Optional
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+import ujson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
 from src.conf import config  # noqa: F401
 from src.log import logger
-from src.models.preset import DBPreset
+from src.models.preset import (
+    LIST_FIELDS,
+    DBPreset,
+    detail_cache,
+    list_response_cache,
+    near_duplicate_index,
+)
 from src.models.user import DBUser
 from src.schemas.message import Ret
 from src.schemas.perm import Role
 from src.schemas.preset import (
+    PresetBatchDetail,
     PresetCreate,
+    PresetImport,
     PresetQuery,
     PresetUpdate,
 )
+from src.services.guard import charge_route, get_client_ip
+from src.services.trending import trending_tracker
+from src.services.used_count import used_count_buffer
+from src.utils.compression import (
+    EncodedBody,
+    encoded_etag,
+    encoded_response,
+    response_encoding,
+)
+from src.utils.cursor import decode_cursor, encode_cursor
+from src.utils.db import UnitOfWork, get_db, run_db
 from src.utils.deps import get_current_active_user
 from src.utils.md5 import md5
+from src.utils.ndjson import dump_line, iter_lines
 
 ROUTER_TAG = "Preset"
 
+# 摘要模式返回的字段 (不含完整的 self_intro)
+SUMMARY_FIELDS = [name for name in LIST_FIELDS if name != "self_intro"]
+
 router = APIRouter()
 
 
@@ -34,12 +62,63 @@ def get_ip(request: Request):
     return from_ip
 
 
+def list_cache_key(data: PresetQuery, fields: Sequence[str]) -> str:
+    """规范化检索条件作为响应缓存键 (分页参数缺省值与实际查询保持一致)"""
+
+    condition = data.condition.model_dump(mode="json")
+    condition["page"] = condition["page"] or 1
+    condition["page_size"] = condition["page_size"] or 10
+    return ujson.dumps([condition, list(fields), data.preview_length])
+
+
+def detail_data(item) -> Dict[str, Any]:
+    return {
+        "id": item.id,
+        "name": item.name,
+        "preset_key": item.preset_key,
+        "description": item.description,
+        "self_intro": item.self_intro,
+        "uploader": item.uploader,
+        "used_count": item.used_count,
+        "last_update_time": item.last_update_time,
+        "created_time": item.created_time,
+    }
+
+
+def cache_detail(item, generation: int) -> Tuple[str, EncodedBody]:
+    """编码预设详情响应并写入详情缓存，返回 (ETag, 响应体)
+
+    generation 为查询数据库前记下的缓存失效代数，查询期间预设被修改或删除时不写入缓存
+    """
+
+    body = Ret.success("query success", data=detail_data(item)).body
+    cached = (f'"{hashlib.md5(body).hexdigest()}"', EncodedBody(body))
+    detail_cache.set(item.id, cached, generation=generation)
+    return cached
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中当前 ETag (弱比较，各压缩版本的 ETag 均视为命中)"""
+
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    candidates = [tag[2:] if tag.startswith("W/") else tag for tag in candidates]
+    return "*" in candidates or any(
+        tag == etag or tag.startswith(f"{etag[:-1]}-") for tag in candidates
+    )
+
+
 def custom_authorize(request: Request):
     return request.headers.get("Authorization") == md5(config.SUPER_ACCESS_KEY)
 
 
 @router.post("/create", tags=[ROUTER_TAG], summary="创建")
-async def create(data: PresetCreate, request: Request):
+async def create(
+    data: PresetCreate,
+    request: Request,
+    db: UnitOfWork = Depends(get_db),
+):
     """创建 Preset 资源"""
     try:
         item = DBPreset(**data.model_dump())
@@ -48,8 +127,11 @@ async def create(data: PresetCreate, request: Request):
             return Ret.fail("不能冒充 KroMiose!")
 
         preset_id = gen_hashed_id(item.preset_key, item.self_intro)
-        if DBPreset.get_by_id(preset_id):
-            return Ret.fail("预设已存在")
+        if config.NEAR_DUPLICATE_REJECT and not custom_authorize(request):
+            # 与自身 id 相同的是同一预设的重复上传，交由下方的存在性检查处理
+            similar = [_id for _id, _ in near_duplicate_index.find(item.self_intro) if _id != preset_id]
+            if similar:
+                return Ret.fail("已存在内容高度相似的预设", data={"similar": similar[:10]})
 
         item = DBPreset(
             id=preset_id,
@@ -61,96 +143,387 @@ async def create(data: PresetCreate, request: Request):
             from_ip=get_ip(request),
         )
 
-        if DBPreset.add(item):
-            logger.info(f"预设 {item.name}[{item.id}] 上传成功 ({item.from_ip})")
-            return Ret.success(
-                "Create success",
-                data={
-                    "id": item.id,
-                },
-            )
-        logger.error(f"Create {data} resource failed")
-        return Ret.fail("上传预设失败")
+        # 单条 INSERT 忽略 id 冲突，根据是否写入判断预设是否已存在
+        if not await db.run(DBPreset.add, item):
+            return Ret.fail("预设已存在")
+        await db.commit()
+        logger.info(f"预设 {item.name}[{item.id}] 上传成功 ({item.from_ip})")
+        return Ret.success(
+            "Create success",
+            data={
+                "id": item.id,
+            },
+        )
     except:
         logger.error(f"Create {data} resource failed")
         return Ret.fail("Create failed")
 
 
-@router.get("/detail", tags=[ROUTER_TAG], summary="查询详情")
-async def get(_id: str, use: str):
-    """根据 id 查询 Preset 资源"""
+@router.post("/batch_create", tags=[ROUTER_TAG], summary="批量创建")
+async def batch_create(
+    data: List[PresetCreate],
+    request: Request,
+    db: UnitOfWork = Depends(get_db),
+):
+    """批量创建 Preset 资源 (一条多行 INSERT，已存在的预设将被忽略)
+
+    返回与请求顺序一致的预设 id 及实际新增的数量；与已有预设近似重复的预设不会写入，列于 similar
+    """
+    if not data or len(data) > config.BATCH_CREATE_MAX_ITEMS:
+        return Ret.fail(f"每次需上传 1-{config.BATCH_CREATE_MAX_ITEMS} 个预设")
+    if not charge_route("/preset/batch_create", get_client_ip(request), len(data)):
+        return Ret.too_many_requests("上传过于频繁，请稍后再试")
+
+    authorized = custom_authorize(request)
+    if not authorized and any(item.uploader == "KroMiose" for item in data):
+        return Ret.fail("不能冒充 KroMiose!")
+
+    from_ip = get_ip(request)
+    now = datetime.now()
+    ids = []
+    similar: Dict[str, List[str]] = {}
+    rows: Dict[str, Dict[str, Any]] = {}
+    for item in data:
+        preset_id = gen_hashed_id(item.preset_key, item.self_intro)
+        ids.append(preset_id)
+        if preset_id in rows or preset_id in similar:
+            continue
+        if config.NEAR_DUPLICATE_REJECT and not authorized:
+            found = [_id for _id, _ in near_duplicate_index.find(item.self_intro) if _id != preset_id]
+            if found:
+                similar[preset_id] = found[:10]
+                continue
+        rows[preset_id] = {
+            **item.model_dump(),
+            "id": preset_id,
+            "used_count": 0,
+            "from_ip": from_ip,
+            "created_time": now,
+            "last_update_time": now,
+        }
+
+    try:
+        inserted = await db.run(DBPreset.add_many, list(rows.values())) if rows else 0
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Batch create {len(data)} presets failed: {e}")
+        return Ret.fail("Create failed")
+
+    logger.info(f"批量上传预设: 新增 {inserted} 个 ({from_ip})")
+    return Ret.success(
+        "Create success",
+        data={"ids": ids, "inserted": inserted, "similar": similar},
+    )
 
-    item = DBPreset.get_by_id(_id)
-    if not item:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+@router.get("/detail", tags=[ROUTER_TAG], summary="查询详情")
+async def get(_id: str, use: str, request: Request, db: UnitOfWork = Depends(get_db)):
+    """根据 id 查询 Preset 资源
+
+    响应携带由响应体哈希生成的强 ETag，客户端可通过 If-None-Match 重新验证，
+    命中缓存且未变更时返回 304 而不访问数据库；use 为 true 时使用次数先计入缓冲区，
+    由后台任务批量写回
+    """
+
+    cached = detail_cache.get(_id)
+    if cached is None:
+        generation = detail_cache.generation
+        item = await db.run(DBPreset.get_by_id, _id)
+        if not item:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        cached = cache_detail(item, generation)
+    etag, body = cached
 
     if use.lower() == "true":
-        DBPreset.update(item, used_count=item.used_count + 1)
+        used_count_buffer.add(_id)
+        trending_tracker.record(_id)
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        # 304 响应的 ETag 与对应的 200 响应一致 (含编码后缀)
+        headers = {
+            "ETag": encoded_etag(etag, response_encoding(request, body)),
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return encoded_response(request, body, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+@router.post("/details", tags=[ROUTER_TAG], summary="批量查询详情")
+async def get_many(
+    data: PresetBatchDetail,
+    request: Request,
+    db: UnitOfWork = Depends(get_db),
+):
+    """根据 id 批量查询 Preset 资源，结果以 id 为键，不存在的 id 对应 null 并列入 not_found
+
+    优先取自详情缓存，其余通过一次 IN 查询取出 (按未命中缓存的 id 数扣除路由预算)；
+    use 为 true 时各预设的使用次数一并计入缓冲区
+    """
+
+    ids = list(dict.fromkeys(data.ids))
+    if len(ids) > config.BATCH_DETAIL_MAX_IDS:
+        return Ret.fail(f"最多一次查询 {config.BATCH_DETAIL_MAX_IDS} 个预设")
+
+    presets: Dict[str, Any] = {}
+    missing = []
+    for _id in ids:
+        cached = detail_cache.get(_id)
+        if cached is None:
+            missing.append(_id)
+        else:
+            presets[_id] = ujson.loads(cached[1].raw)["data"]
+    if missing:
+        if not charge_route("/preset/details", get_client_ip(request), len(missing)):
+            return Ret.too_many_requests("查询过于频繁，请稍后再试")
+        generation = detail_cache.generation
+        for row in await db.run(DBPreset.get_many, missing):
+            cache_detail(row, generation)
+            presets[row.id] = detail_data(row)
+
+    not_found = [_id for _id in ids if _id not in presets]
+    if data.use:
+        for _id in ids:
+            if _id in presets:
+                used_count_buffer.add(_id)
+                trending_tracker.record(_id)
 
     return Ret.success(
         "query success",
         data={
-            "id": item.id,
-            "name": item.name,
-            "preset_key": item.preset_key,
-            "description": item.description,
-            "self_intro": item.self_intro,
-            "uploader": item.uploader,
-            "used_count": item.used_count,
-            "last_update_time": item.last_update_time,
-            "created_time": item.created_time,
+            "presets": {_id: presets.get(_id) for _id in ids},
+            "not_found": not_found,
         },
     )
 
 
 @router.post("/list", tags=[ROUTER_TAG], summary="检索分页")
-async def query(data: PresetQuery):
+async def query(data: PresetQuery, request: Request, db: UnitOfWork = Depends(get_db)):
     """根据条件检索 Preset 资源"""
 
     try:
-        # TODO DBPreset.query 方法默认提供了分页、排序、关键字过滤，如果需要其他条件需自行实现
+        fields = data.fields or (SUMMARY_FIELDS if data.projection == "summary" else LIST_FIELDS)
+        if data.preview_length and "self_intro" not in fields:
+            fields = [*fields, "self_intro"]
+
+        # 命中缓存时直接返回编码好的响应体
+        cache_key = list_cache_key(data, fields)
+        body = list_response_cache.get(cache_key)
+        if body is not None:
+            return encoded_response(request, body)
+
+        # 未命中缓存的检索按开销扣除路由预算，超出预算时在查询数据库前拒绝
+        condition = data.condition
+        page_size = condition.page_size or 10
+        if not charge_route(
+            "/preset/list",
+            get_client_ip(request),
+            page_size,
+            keyword=condition.keyword,
+            offset=0 if condition.cursor is not None else ((condition.page or 1) - 1) * page_size,
+            with_total=condition.with_total,
+        ):
+            return Ret.too_many_requests("检索过于频繁，请稍后再试")
+
+        # DBPreset.query 负责分页 (页码 / 游标)、排序、关键字检索与结构化筛选 (filters)
+        # 查询期间有写入提交 (缓存被清空) 时不缓存本次结果
+        generation = list_response_cache.generation
         try:
-            items, total = DBPreset.query(data.condition)
+            items, total, next_cursor = await db.run(
+                DBPreset.query,
+                data.condition,
+                fields=fields,
+                preview_length=data.preview_length,
+            )
         except Exception as e:
             logger.error(f"Query {data} resource failed: {e}")
             return Ret.fail("Query failed, please check your parameter and try again")
 
-        return Ret.success(
+        body = Ret.success(
             "query success",
             data={
-                "list": [
-                    {
-                        "id": item.id,
-                        "name": item.name,
-                        "preset_key": item.preset_key,
-                        "description": item.description,
-                        "self_intro": item.self_intro,
-                        "uploader": item.uploader,
-                        "used_count": item.used_count,
-                        "created_time": item.created_time,
-                        "last_update_time": item.last_update_time,
-                    }
-                    for item in items
-                ],
+                "list": [{name: getattr(item, name) for name in fields} for item in items],
                 "total": total,
+                "next_cursor": next_cursor,
             },
-        )
+        ).body
+        body = EncodedBody(body)
+        list_response_cache.set(cache_key, body, generation=generation)
+        return encoded_response(request, body)
     except Exception as e:
         logger.error(f"Query {data} resource failed: {e}")
         return Ret.fail("Query failed")
 
 
+@router.get("/export", tags=[ROUTER_TAG], summary="导出全部 (NDJSON)")
+async def export(request: Request):
+    """以 NDJSON 流式导出全部 Preset 资源 (需要超级访问密钥)，每行一个预设"""
+    if not custom_authorize(request):
+        return Ret.fail("预设中心访问权限受限")
+
+    def iter_chunks() -> Iterator[bytes]:
+        # 每批行合并为一个响应块，减少线程池调度次数
+        chunk = []
+        for row in DBPreset.iter_all(config.EXPORT_BATCH_SIZE):
+            chunk.append(dump_line(row._asdict()))
+            if len(chunk) >= config.EXPORT_BATCH_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+        if chunk:
+            yield b"".join(chunk)
+
+    return StreamingResponse(
+        iter_chunks(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=presets.ndjson"},
+    )
+
+
+@router.post("/import", tags=[ROUTER_TAG], summary="批量导入 (NDJSON)")
+async def import_(request: Request):
+    """从请求体中逐行读取 NDJSON 批量导入 Preset 资源 (需要超级访问密钥)
+
+    每行格式与导出一致，id 由 preset_key 与 self_intro 重新生成；
+    每 IMPORT_BATCH_SIZE 行在独立事务中写入，已存在的预设将被跳过
+    """
+    if not custom_authorize(request):
+        return Ret.fail("预设中心访问权限受限")
+
+    from_ip = get_ip(request)
+    progress = {"received": 0, "inserted": 0, "skipped": 0, "invalid": 0, "batches": 0}
+    errors = []
+    batch: Dict[str, Dict[str, Any]] = {}
+
+    async def write_batch():
+        inserted = await run_db(DBPreset.add_many, list(batch.values()))
+        progress["batches"] += 1
+        progress["inserted"] += inserted
+        progress["skipped"] += len(batch) - inserted
+        batch.clear()
+        logger.info(f"导入预设: 第 {progress['batches']} 批完成 {progress}")
+
+    try:
+        async for line_no, line in iter_lines(request.stream(), config.IMPORT_MAX_LINE_SIZE):
+            progress["received"] += 1
+            try:
+                item = PresetImport.model_validate(ujson.loads(line))
+            except (ValueError, ValidationError) as e:
+                progress["invalid"] += 1
+                if len(errors) < 10:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+
+            now = datetime.now()
+            preset_id = gen_hashed_id(item.preset_key, item.self_intro)
+            if preset_id in batch:
+                progress["skipped"] += 1
+                continue
+            batch[preset_id] = {
+                "id": preset_id,
+                "name": item.name,
+                "preset_key": item.preset_key,
+                "description": item.description,
+                "self_intro": item.self_intro,
+                "uploader": item.uploader,
+                "used_count": item.used_count,
+                "from_ip": from_ip,
+                "created_time": item.created_time or now,
+                "last_update_time": now,
+            }
+            if len(batch) >= config.IMPORT_BATCH_SIZE:
+                await write_batch()
+        if batch:
+            await write_batch()
+    except Exception as e:
+        # 已完成的批次已提交，返回截至出错时的进度
+        logger.error(f"Import presets failed: {e}")
+        return Ret.fail(f"Import failed: {e}", data={**progress, "errors": errors})
+
+    return Ret.success("Import success", data={**progress, "errors": errors})
+
+
+@router.get("/clusters", tags=[ROUTER_TAG], summary="近似重复预设")
+async def clusters(request: Request, limit: int = 50, db: UnitOfWork = Depends(get_db)):
+    """列出预设信息互为近似重复的预设簇 (需要超级访问密钥)，按簇大小倒序"""
+    if not custom_authorize(request):
+        return Ret.fail("预设中心访问权限受限")
+
+    found = near_duplicate_index.clusters()
+    shown = [ids[:20] for ids in found[: max(1, min(limit, 200))]]
+    rows = await db.run(
+        DBPreset.get_many,
+        [_id for ids in shown for _id in ids],
+        fields=("id", "name", "preset_key", "uploader", "used_count", "created_time"),
+    )
+    by_id = {row.id: row._asdict() for row in rows}
+    return Ret.success(
+        "query success",
+        data={
+            "total": len(found),
+            "index_ready": near_duplicate_index.ready,
+            "clusters": [
+                {
+                    "size": len(ids),
+                    "presets": [by_id[_id] for _id in shown_ids if _id in by_id],
+                }
+                for ids, shown_ids in zip(found, shown)
+            ],
+        },
+    )
+
+
+@router.get("/sync", tags=[ROUTER_TAG], summary="增量同步")
+async def sync(
+    request: Request,
+    since: str = "",
+    limit: int = 500,
+    db: UnitOfWork = Depends(get_db),
+):
+    """返回水位线之后新增、修改或删除的 Preset 资源
+
+    首次同步 since 传空字符串，之后传入上次返回的 watermark；
+    客户端应先删除 deleted 中的预设再写入 presets，has_more 为 true 时应继续同步
+    """
+
+    limit = max(1, min(limit, config.SYNC_MAX_LIMIT))
+    try:
+        watermark = tuple(decode_cursor(since, datetime, str)) if since else None
+    except ValueError as e:
+        return Ret.fail(str(e))
+    if not charge_route("/preset/sync", get_client_ip(request), limit):
+        return Ret.too_many_requests("同步过于频繁，请稍后再试")
+
+    # 只返回安全延迟之前的变更，尚未提交的事务写入的修改时间不会落在已返回的水位线之前
+    until = datetime.now() - timedelta(seconds=config.SYNC_SAFETY_LAG)
+    presets, deleted, next_watermark, has_more = await db.run(
+        DBPreset.changes_since,
+        watermark,
+        until,
+        limit,
+    )
+    return Ret.success(
+        "sync success",
+        data={
+            "presets": [row._asdict() for row in presets],
+            "deleted": deleted,
+            "watermark": encode_cursor(*next_watermark) if next_watermark else "",
+            "has_more": has_more,
+        },
+    )
+
+
 @router.put("/update", tags=[ROUTER_TAG], summary="更新数据")
-async def update(data: PresetUpdate):
+async def update(data: PresetUpdate, db: UnitOfWork = Depends(get_db)):
     """根据 id 更新 Example 资源"""
-    item = DBPreset.get_by_id(data.id)
+    item = await db.run(DBPreset.get_by_id, data.id)
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     try:
         update_data = data.model_dump()
         # ... deal with update
 
-        DBPreset.update(item, **update_data)
+        await db.run(DBPreset.update, item, **update_data)
+        await db.commit()
         return Ret.success("Update success", data={"id": item.id, "name": item.name})
     except Exception as e:
         logger.error(f"Update {data} resource failed: {e}")
@@ -158,14 +531,19 @@ async def update(data: PresetUpdate):
 
 
 @router.delete("/delete", tags=[ROUTER_TAG], summary="删除数据")
-async def delete(_id: str, request: Request):
+async def delete(
+    _id: str,
+    request: Request,
+    db: UnitOfWork = Depends(get_db),
+):
     """根据 id 删除 Preset 资源"""
     if not custom_authorize(request):
         return Ret.fail("预设中心访问权限受限")
 
     try:
-        item = DBPreset.get_by_id(_id)
-        DBPreset.delete(item)
+        item = await db.run(DBPreset.get_by_id, _id)
+        await db.run(DBPreset.delete, item)
+        await db.commit()
         return Ret.success("Delete success")
     except Exception as e:
         logger.error(f"Delete resource(id: {_id}) failed: {e}")
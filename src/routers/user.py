@@ -14,6 +14,7 @@ from src.utils.auth import (
     get_perm_role,
     verify_password,
 )
+from src.utils.db import UnitOfWork, get_db
 from src.utils.deps import get_current_active_user
 
 ROUTER_TAG = "User"
@@ -22,14 +23,15 @@ router = APIRouter()
 
 
 @router.post("/register", tags=[ROUTER_TAG], summary="用户注册")
-async def register(data: UserCreate):
+async def register(data: UserCreate, db: UnitOfWork = Depends(get_db)):
     if data.access_key != config.SUPER_ACCESS_KEY:
         return Ret.fail("Permission denied")
     logger.info(f"User: {data} is registering...")
-    if DBUser.get_by_username(data.username):
+    if await db.run(DBUser.get_by_username, data.username):
         return Ret.fail("Username already exists")
     try:
-        DBUser.add(
+        await db.run(
+            DBUser.add,
             DBUser(
                 username=data.username,
                 password=get_hashed_password(data.password),
@@ -43,12 +45,12 @@ async def register(data: UserCreate):
 
 
 @router.post("/login", tags=[ROUTER_TAG], summary="用户登录")
-async def login(data: UserLogin):
-    user = DBUser.get_by_username(data.username)
+async def login(data: UserLogin, db: UnitOfWork = Depends(get_db)):
+    user = await db.run(DBUser.get_by_username, data.username)
     logger.info(f"User: {user.username if user else 'Unknown'} is logging in...")
     if user and verify_password(data.password, user.password):  # type: ignore
         logger.info(f"User {user.username} logging in successfully...")
-        DBUser.update(user, login_time=datetime.now())
+        await db.run(DBUser.update, user, login_time=datetime.now())
         return UserToken(
             access_token=create_access_token(user.username),
             refresh_token=create_refresh_token(user.username),
@@ -63,14 +65,14 @@ async def login(data: UserLogin):
 
 
 @router.post("/edit", tags=[ROUTER_TAG], summary="用户更新")
-async def edit(data: UserUpdate):
+async def edit(data: UserUpdate, db: UnitOfWork = Depends(get_db)):
     if data.access_key != config.SUPER_ACCESS_KEY:
         return Ret.fail("Permission denied")
-    if user := DBUser.get_by_username(data.username):
+    if user := await db.run(DBUser.get_by_username, data.username):
         model_dict = data.model_dump()
         del model_dict["access_key"]
         del model_dict["username"]
-        DBUser.update(user, **model_dict)
+        await db.run(DBUser.update, user, **model_dict)
         return Ret.success("Update success")
     return Ret.fail("User not found")
 
@@ -1,15 +1,28 @@
-from typing import Any
+from typing import Any, Mapping, Optional
 
 from pydantic import BaseModel
 
+from src.utils.response import FastJSONResponse
 
-class Ret(BaseModel):
-    code: int
-    msg: str
-    data: Any
 
-    def __init__(self, code: int, msg: str, data: Any):
-        super().__init__(code=code, msg=msg, data=data)
+class Ret(FastJSONResponse):
+    """统一响应格式 {code, msg, data}
+
+    本身即为 JSON 响应，构造时直接编码，不经过 Pydantic 校验与 jsonable_encoder；
+    编码后的响应体可通过 body 属性获取
+    """
+
+    def __init__(
+        self,
+        code: int,
+        msg: str,
+        data: Any = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        self.code = code
+        self.msg = msg
+        self.data = data
+        super().__init__({"code": code, "msg": msg, "data": data}, headers=headers)
 
     @classmethod
     def success(cls, msg: str, data: Any = None):
@@ -23,6 +36,13 @@ class Ret(BaseModel):
     def error(cls, msg: str, data: Any = None):
         return cls(code=500, msg=msg, data=data)
 
+    @classmethod
+    def too_many_requests(cls, msg: str, data: Any = None):
+        """访问频率受限 (HTTP 状态码同为 429)"""
+        ret = cls(code=429, msg=msg, data=data)
+        ret.status_code = 429
+        return ret
+
 
 class UserToken(BaseModel):
     code: int
@@ -37,7 +57,3 @@ class UserToken(BaseModel):
             refresh_token=refresh_token,
             token_type=token_type,
         )
-
-
-class LoginRet(Ret):
-    data: UserToken
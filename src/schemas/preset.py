@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Preset(BaseModel):
@@ -10,30 +10,52 @@ class Preset(BaseModel):
     created_time: datetime
 
 class OrderOption(BaseModel):
-    field_name: str
+    field_name: str  # 排序字段，留空或 "relevance" 时关键字检索按相关度排序，"trending" 按近期热度排序
     desc: bool
 
 class FilterOption(BaseModel):
     field_name: str
-    value: str
+    op: Literal["eq", "prefix", "in", "range"] = "eq"
+    value: Optional[str] = None  # eq / prefix
+    values: Optional[List[str]] = None  # in
+    min_value: Optional[str] = None  # range 下界 (包含)
+    max_value: Optional[str] = None  # range 上界 (包含)
 
 class QueryCondition(BaseModel):
     page: int
     page_size: int
     order_by: OrderOption
-    keyword: str
+    keyword: str  # 在名称、描述与预设信息中全文检索
     filters: List[FilterOption]
+    # 游标分页: 首页传空字符串，之后传入上一页返回的 next_cursor；
+    # 未指定排序字段时按使用次数倒序 (含关键字检索)，不支持 relevance 排序
+    cursor: Optional[str] = None
+    with_total: bool = True  # 是否返回结果总数 (无限滚动等场景可关闭以减少查询)
 
 class PresetCreate(BaseModel):
-    name: str
-    preset_key: str
-    self_intro: str
-    uploader: str
-    description: str
+    # 长度上限与数据表字段一致 (批量写入忽略冲突时 MySQL 不会因超长报错而是截断)
+    name: str = Field(max_length=255)
+    preset_key: str = Field(max_length=32)
+    self_intro: str = Field(max_length=8192)
+    uploader: str = Field(max_length=255)
+    description: str = Field(max_length=255)
+
+class PresetImport(PresetCreate):
+    # 以下字段缺省时按新建处理 (与导出格式一致，可直接导入导出的数据)
+    # 导出数据中的 last_update_time 会被忽略: 导入的行以导入时间作为修改时间，以便增量同步
+    used_count: int = 0
+    created_time: Optional[datetime] = None
 
 class PresetUpdate(BaseModel):
     id: int
     name: str
 
+class PresetBatchDetail(BaseModel):
+    ids: List[str] = Field(min_length=1)
+    use: bool = False  # 是否计入各预设的使用次数
+
 class PresetQuery(BaseModel):
     condition: QueryCondition
+    projection: Literal["full", "summary"] = "full"  # summary: 不返回完整的 self_intro
+    fields: Optional[List[str]] = None  # 指定返回字段 (优先于 projection)
+    preview_length: Optional[int] = Field(default=None, ge=1)  # 在服务端将 self_intro 截断为指定长度
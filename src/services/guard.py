@@ -1,55 +1,476 @@
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
 import time
-from typing import Dict, List
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
-from pydantic import BaseModel
+from starlette.requests import Request
 
 from src.conf import config
+from src.log import logger
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非 Unix 平台不支持多进程共享
+    fcntl = None
 
-class AccRecord(BaseModel):
-    ip: str
-    recent_access_records: List = []
-    banned_until: int = 0
+WINDOW = 60  # 限流统计窗口 (秒)
+BAN_TIERS = range(7, 1, -1)  # 请求频率超过限额的倍数对应的封禁时长 (倍数 * WINDOW 秒)，从高到低匹配
+SWEEP_PER_CHECK = 2  # 每次检查时最多清理的闲置计数条目数
+QUERY_COST_ROWS = 20  # 检索开销: 每返回该数量的行计 1
+QUERY_COST_KEYWORD = 4  # 检索开销: 关键字检索额外计入的开销
+QUERY_COST_OFFSET_ROWS = 1000  # 检索开销: 偏移分页每跳过该数量的行计 1
+WRITE_COST_ROWS = 5  # 写入开销: 每写入该数量的行计 1
+
+
+class AccRecord:
+    """单个 IP 的访问计数 (滑动窗口计数器)
+
+    按固定窗口计数，以上一窗口的计数按其与最近 WINDOW 秒的重叠比例加权估算请求频率，
+    每次检查的开销与占用的内存均为常数，与请求频率无关。
+    分别统计全部请求 (hits，用于判定封禁) 与放行的请求 (accepted，用于限流)
+    """
+
+    __slots__ = (
+        "current_accepted",
+        "current_hits",
+        "previous_accepted",
+        "previous_hits",
+        "window",
+    )
+
+    def __init__(
+        self,
+        window: int = 0,
+        previous_hits: int = 0,
+        current_hits: int = 0,
+        previous_accepted: int = 0,
+        current_accepted: int = 0,
+    ):
+        self.window = window
+        self.previous_hits = previous_hits
+        self.current_hits = current_hits
+        self.previous_accepted = previous_accepted
+        self.current_accepted = current_accepted
+
+    def _rotate(self, now: float):
+        window = int(now // WINDOW)
+        if window == self.window:
+            return
+        if window == self.window + 1:
+            self.previous_hits, self.previous_accepted = self.current_hits, self.current_accepted
+        else:
+            self.previous_hits = self.previous_accepted = 0
+        self.current_hits = self.current_accepted = 0
+        self.window = window
+
+    def is_idle(self, now: float) -> bool:
+        """最近 WINDOW 秒内没有计数 (移除后不影响限流结果)"""
+
+        return self.window < int(now // WINDOW) - 1
+
+    def rates(self, now: float) -> Tuple[float, float]:
+        """估算最近 WINDOW 秒内的 (全部请求数, 放行请求数)"""
+
+        self._rotate(now)
+        weight = 1 - (now % WINDOW) / WINDOW
+        return (
+            self.previous_hits * weight + self.current_hits,
+            self.previous_accepted * weight + self.current_accepted,
+        )
+
+    def hit(self, now: float, cost: int = 1) -> Tuple[float, float]:
+        """记录一次请求 (计为 cost 次)，返回计入该请求后的频率估算"""
+
+        self._rotate(now)
+        self.current_hits += cost
+        return self.rates(now)
+
+    def accept(self, cost: int = 1):
+        self.current_accepted += cost
+
+
+def decide(
+    hit_rate: float,
+    access_rate: float,
+    banned_until: float,
+    now: float,
+    auto_ban: bool = True,
+    cost: int = 1,
+    limit: Optional[int] = None,
+) -> Tuple[bool, float]:
+    """根据请求频率与封禁状态判定是否放行，返回 (是否放行, 更新后的封禁截止时间)
+
+    limit 为每 WINDOW 秒允许放行的请求开销总和，默认为 ACCESS_QPM_LIMIT
+    """
+
+    limit = config.ACCESS_QPM_LIMIT if limit is None else limit
+    if auto_ban:
+        for i in BAN_TIERS:
+            if hit_rate > limit * i:
+                return False, max(banned_until, now + WINDOW * i)
+
+    if banned_until > now:
+        return False, banned_until
+
+    return access_rate + cost <= limit, banned_until
+
+
+class AccessGuard:
+    """IP 访问频率限制 (进程内)
+
+    访问计数表按最近访问顺序保存 (LRU)，超过 max_records 时淘汰最久未访问的条目，
+    每次检查时顺带清理少量已闲置的条目；封禁记录单独保存直至到期，不受计数条目淘汰的影响
+    """
+
+    def __init__(self, max_records: int):
+        self.max_records = max_records
+        self.records: "OrderedDict[str, AccRecord]" = OrderedDict()
+        self.bans: Dict[str, float] = {}
+        self.evictions = 0  # 因容量不足淘汰的计数条目数
+        self.expirations = 0  # 因闲置清理的计数条目数
+        self._bans_swept_at = 0.0
+
+    def _sweep(self, now: float):
+        for _ in range(SWEEP_PER_CHECK):
+            if not self.records:
+                break
+            ip, record = next(iter(self.records.items()))
+            if not record.is_idle(now):
+                break
+            del self.records[ip]
+            self.expirations += 1
+
+        # 封禁记录数量有限 (每个 IP 需先超出数倍限额)，每个窗口清理一次过期的封禁
+        if now - self._bans_swept_at >= WINDOW:
+            self.bans = {ip: until for ip, until in self.bans.items() if until > now}
+            self._bans_swept_at = now
+
+    def _get_record(self, ip: str) -> AccRecord:
+        record = self.records.get(ip)
+        if record is None:
+            record = self.records[ip] = AccRecord()
+            if len(self.records) > self.max_records:
+                self.records.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.records.move_to_end(ip)
+        return record
+
+    def check(
+        self,
+        ip: str,
+        now: float,
+        auto_ban: bool = True,
+        cost: int = 1,
+        limit: Optional[int] = None,
+    ) -> bool:
+        """记录一次请求 (开销为 cost) 并返回是否放行"""
+
+        self._sweep(now)
+        record = self._get_record(ip)
+        hit_rate, access_rate = record.hit(now, cost)
+        banned_until = self.bans.get(ip, 0.0)
+        allowed, until = decide(
+            hit_rate,
+            access_rate,
+            banned_until,
+            now,
+            auto_ban,
+            cost,
+            limit,
+        )
+        if until != banned_until:
+            self.bans[ip] = until
+        if allowed:
+            record.accept(cost)
+        return allowed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": len(self.records),
+            "max_size": self.max_records,
+            "bans": len(self.bans),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
 
-    def calc_access_qps(self, sec: int) -> float:
-        """计算最近 sec 秒的访问频率"""
-        now = time.time()
-        recent_records = [
-            record for record in self.recent_access_records if record > now - sec
-        ]
-        return len(recent_records) / sec
 
-    def drop_expired_records(self, sec: int):
-        """删除过期的访问记录"""
+# 共享表的文件布局: 文件头 | 各段 (段头 | 计数条目 | 封禁条目)
+FILE_HEADER = struct.Struct("<8sIII")  # 标识, 段数, 每段计数条目数, 每段封禁条目数
+STRIPE_HEADER = struct.Struct("<QQQ")  # 已使用的计数条目数, 淘汰数, 闲置复用数
+RECORD_SLOT = struct.Struct("<QqIIIId")  # IP 哈希, AccRecord 各字段, 最近访问时间
+BAN_SLOT = struct.Struct("<Qd")  # IP 哈希, 封禁截止时间
+MAGIC = b"PHGUARD1"
+PROBE = 8  # 段内线性探测的最大条目数
+
+
+def _hash_ip(ip: str) -> int:
+    """IP 的 64 位哈希 (各进程一致，0 表示空条目)"""
+
+    return int.from_bytes(hashlib.blake2b(ip.encode(), digest_size=8).digest(), "little") or 1
+
+
+class SharedAccessGuard:
+    """多进程共享的 IP 访问频率限制 (同一主机)
+
+    计数与封禁记录保存在各进程以 mmap 映射的同一文件中，检查时只在本机内存中读写，不经过网络。
+    表按 IP 哈希分为若干段，每段以 fcntl 字节范围锁保护，一次检查只锁定所在的段；
+    段内以线性探测查找条目，探测范围已满时优先复用闲置的计数条目，否则淘汰最久未访问的条目，
+    封禁记录保存在单独的区域，只在到期后被复用 (已满时替换最早到期的封禁)
+    """
+
+    def __init__(self, path: Union[str, Path], max_records: int, max_bans: int, stripes: int = 64):
+        self.path = str(path)
+        self.stripes = stripes
+        self.record_slots = max(max_records // stripes, PROBE)
+        self.ban_slots = max(max_bans // stripes, PROBE)
+        self.stripe_size = (
+            STRIPE_HEADER.size
+            + self.record_slots * RECORD_SLOT.size
+            + self.ban_slots * BAN_SLOT.size
+        )
+        size = FILE_HEADER.size + stripes * self.stripe_size
+        header = FILE_HEADER.pack(MAGIC, stripes, self.record_slots, self.ban_slots)
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # 首个进程初始化文件 (布局与配置不一致时重建)，其余进程等待后直接映射
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size or os.pread(self._fd, len(header), 0) != header:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, size)
+        # fcntl 锁属于进程，同一进程的多个线程之间另需互斥
+        self._lock = threading.Lock()
+
+    def _probe(self, base: int, slots: int, slot_size: int, key: int):
+        start = (key // self.stripes) % slots
+        for i in range(PROBE):
+            yield base + (start + i) % slots * slot_size
+
+    def _load_record(self, base: int, key: int, now: float) -> Tuple[int, AccRecord]:
+        """查找 IP 的计数条目，不存在时分配 (空条目 > 闲置条目 > 最久未访问的条目)"""
+
+        mm = self._mm
+        victim, victim_seen, victim_idle = 0, 0.0, False
+        for offset in self._probe(base + STRIPE_HEADER.size, self.record_slots, RECORD_SLOT.size, key):
+            slot_key, *fields, last_seen = RECORD_SLOT.unpack_from(mm, offset)
+            if slot_key == key:
+                return offset, AccRecord(*fields)
+            if slot_key == 0:
+                # 计数条目只会被复用而不会被清空，遇到空条目说明该 IP 不在表中
+                self._count(base, 0)
+                return offset, AccRecord()
+            idle = AccRecord(*fields).is_idle(now)
+            if not victim or (idle, -last_seen) > (victim_idle, -victim_seen):
+                victim, victim_seen, victim_idle = offset, last_seen, idle
+        self._count(base, 2 if victim_idle else 1)
+        return victim, AccRecord()
+
+    def _count(self, base: int, index: int):
+        counters = list(STRIPE_HEADER.unpack_from(self._mm, base))
+        counters[index] += 1
+        STRIPE_HEADER.pack_into(self._mm, base, *counters)
+
+    def _ban_region(self, base: int) -> int:
+        return base + STRIPE_HEADER.size + self.record_slots * RECORD_SLOT.size
+
+    def _banned_until(self, base: int, key: int) -> float:
+        for offset in self._probe(self._ban_region(base), self.ban_slots, BAN_SLOT.size, key):
+            slot_key, until = BAN_SLOT.unpack_from(self._mm, offset)
+            if slot_key == key:
+                return until
+            if slot_key == 0:
+                break
+        return 0.0
+
+    def _ban(self, base: int, key: int, until: float):
+        target, target_until = 0, 0.0
+        for offset in self._probe(self._ban_region(base), self.ban_slots, BAN_SLOT.size, key):
+            slot_key, slot_until = BAN_SLOT.unpack_from(self._mm, offset)
+            if slot_key == key or slot_key == 0:
+                target = offset
+                break
+            # 探测范围已满时替换最早到期的封禁 (已到期的封禁最先被替换)
+            if not target or slot_until < target_until:
+                target, target_until = offset, slot_until
+        BAN_SLOT.pack_into(self._mm, target, key, until)
+
+    def check(
+        self,
+        ip: str,
+        now: float,
+        auto_ban: bool = True,
+        cost: int = 1,
+        limit: Optional[int] = None,
+    ) -> bool:
+        """记录一次请求 (开销为 cost) 并返回是否放行"""
+
+        key = _hash_ip(ip)
+        stripe = key % self.stripes
+        base = FILE_HEADER.size + stripe * self.stripe_size
+        with self._lock:
+            # 以文件中第 stripe 个字节作为该段的锁 (仅作标记，不影响映射的数据)
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                offset, record = self._load_record(base, key, now)
+                hit_rate, access_rate = record.hit(now, cost)
+                banned_until = self._banned_until(base, key)
+                allowed, until = decide(
+                    hit_rate,
+                    access_rate,
+                    banned_until,
+                    now,
+                    auto_ban,
+                    cost,
+                    limit,
+                )
+                if until != banned_until:
+                    self._ban(base, key, until)
+                if allowed:
+                    record.accept(cost)
+                RECORD_SLOT.pack_into(
+                    self._mm,
+                    offset,
+                    key,
+                    record.window,
+                    record.previous_hits,
+                    record.current_hits,
+                    record.previous_accepted,
+                    record.current_accepted,
+                    now,
+                )
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        return allowed
+
+    def stats(self) -> Dict[str, Any]:
+        size = evictions = expirations = bans = 0
         now = time.time()
-        self.recent_access_records = [
-            record for record in self.recent_access_records if record > now - sec
-        ]
+        for stripe in range(self.stripes):
+            base = FILE_HEADER.size + stripe * self.stripe_size
+            used, evicted, expired = STRIPE_HEADER.unpack_from(self._mm, base)
+            size, evictions, expirations = size + used, evictions + evicted, expirations + expired
+            region = self._ban_region(base)
+            for i in range(self.ban_slots):
+                slot_key, until = BAN_SLOT.unpack_from(self._mm, region + i * BAN_SLOT.size)
+                if slot_key and until > now:
+                    bans += 1
+        return {
+            "backend": "shared",
+            "path": self.path,
+            "size": size,
+            "max_size": self.stripes * self.record_slots,
+            "bans": bans,
+            "evictions": evictions,
+            "expirations": expirations,
+        }
+
+
+def create_access_guard() -> Union[AccessGuard, SharedAccessGuard]:
+    """按 GUARD_BACKEND 配置创建访问频率限制，无法使用共享表时退回进程内实现"""
 
+    backend = config.GUARD_BACKEND
+    if backend == "auto":
+        backend = "shared" if config.WORKERS > 1 else "memory"
+    if backend == "shared":
+        if fcntl is None:
+            logger.warning("当前平台不支持 fcntl，访问频率限制退回进程内实现 (各 worker 分别计数)")
+        else:
+            directory = Path("/dev/shm")
+            if not directory.is_dir():
+                directory = Path(tempfile.gettempdir())
+            path = config.GUARD_SHARED_PATH or directory / f"presethub-guard-{config.PORT}"
+            try:
+                return SharedAccessGuard(
+                    path=path,
+                    max_records=config.GUARD_MAX_RECORDS,
+                    max_bans=config.GUARD_MAX_BANS,
+                )
+            except OSError as e:
+                logger.warning(f"无法创建共享访问频率限制表 {path}: {e}，退回进程内实现")
+    return AccessGuard(max_records=config.GUARD_MAX_RECORDS)
 
-acc_records: Dict[str, AccRecord] = {}
 
+access_guard = create_access_guard()
 
-def check_ip_accessible(ip: str, auto_ban: bool = True) -> bool:
+
+def get_client_ip(request: Request) -> str:
+    """请求来源 IP (经本机或内网反向代理时取 X-Forwarded-For)"""
+    ip = request.client.host  # type: ignore
+    return (
+        request.headers.get("X-Forwarded-For", "")
+        if not ip or ip == "127.0.0.1" or ip.startswith("192.168.")
+        else ip
+    )
+
+
+def check_ip_accessible(ip: str, auto_ban: bool = True, now: Optional[float] = None) -> bool:
     """检查 IP 是否可访问"""
-    if ip not in acc_records:
-        acc_records[ip] = AccRecord(ip=ip)
+    return access_guard.check(ip, time.time() if now is None else now, auto_ban)
 
-    ip_record = acc_records[ip]
-    ip_record.drop_expired_records(300)
-    access_rate = ip_record.calc_access_qps(60)
 
-    if auto_ban:
-        for i in range(2, 8):
-            if access_rate > config.ACCESS_QPM_LIMIT * i:
-                ip_record.banned_until = int(time.time() + 60 * i)
-                return False
+def query_cost(page_size: int, keyword: str = "", offset: int = 0, with_total: bool = False) -> int:
+    """估算检索请求的开销 (以一次普通请求为 1)
+
+    开销随返回行数、关键字检索、偏移分页跳过的行数与总数统计增加
+    """
+    cost = 1 + max(page_size, 0) // QUERY_COST_ROWS
+    if keyword:
+        cost += QUERY_COST_KEYWORD
+    if with_total:
+        cost += 1
+    return cost + max(offset, 0) // QUERY_COST_OFFSET_ROWS
+
+
+def rows_cost(rows: int) -> int:
+    """估算读取 rows 行的请求开销"""
+    return 1 + max(rows, 0) // QUERY_COST_ROWS
+
+
+def write_cost(rows: int) -> int:
+    """估算写入 rows 行的请求开销"""
+    return 1 + max(rows, 0) // WRITE_COST_ROWS
+
+
+# 各多行路由的开销估算函数，参数由路由处理函数按请求传入
+ROUTE_COSTS: Dict[str, Callable[..., int]] = {
+    "/preset/list": query_cost,
+    "/preset/details": rows_cost,
+    "/preset/sync": rows_cost,
+    "/preset/batch_create": write_cost,
+}
 
-    if acc_records[ip].banned_until > time.time():
-        return False
 
-    if access_rate > config.ACCESS_QPM_LIMIT:
-        return False
+def charge_route(
+    route: str,
+    ip: str,
+    *args: Any,
+    now: Optional[float] = None,
+    **kwargs: Any,
+) -> bool:
+    """按 ROUTE_COSTS 估算请求开销并扣除 ROUTE_COST_BUDGETS 中的路由预算，预算不足时返回 False
 
-    ip_record.recent_access_records.append(time.time())
-    return True
+    args / kwargs 传给路由的开销估算函数；
+    各路由对每个 IP 单独计算预算 (与全局的访问频率限制共用计数表)，预算不足不会触发封禁
+    """
+    budget = config.ROUTE_COST_BUDGETS.get(route)
+    if budget is None:
+        return True
+    return access_guard.check(
+        f"{route}|{ip}",
+        time.time() if now is None else now,
+        auto_ban=False,
+        cost=ROUTE_COSTS[route](*args, **kwargs),
+        limit=budget,
+    )
@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import heapq
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from src.conf import config
+from src.log import logger
+
+
+class TrendingTracker:
+    """预设热度统计: 按使用事件累计指数衰减的热度分数，并定期生成排行快照
+
+    分数以 epoch 时刻为基准保存 (事件权重为 2^((t - epoch) / half_life))，
+    各预设的分数同比例衰减，记录事件时无需更新其他预设；
+    生成快照时将分数换算到当前时刻并重置 epoch，同时移除低于 min_score 的预设以限制内存；
+    discard 由提交后回调在线程池中调用，分数表的读写均需持有锁
+    """
+
+    def __init__(self, half_life: float, size: int, min_score: float, interval: float):
+        self.half_life = half_life
+        self.size = size
+        self.min_score = min_score
+        self.interval = interval
+        self.ranking: List[str] = []  # 最近一次快照的排行 (预设 id，按热度倒序)
+        self.snapshot_time: Optional[float] = None
+        self._scores: Dict[str, float] = {}
+        self._epoch = time.time()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    def _weight(self, now: float) -> float:
+        return 2 ** ((now - self._epoch) / self.half_life)
+
+    def record(self, _id: str, count: int = 1):
+        """记录使用事件"""
+
+        with self._lock:
+            self._scores[_id] = self._scores.get(_id, 0.0) + count * self._weight(time.time())
+
+    def discard(self, _id: str):
+        with self._lock:
+            self._scores.pop(_id, None)
+            if _id in self.ranking:
+                self.ranking = [item for item in self.ranking if item != _id]
+
+    def snapshot(self):
+        """将分数换算到当前时刻并生成排行快照"""
+
+        with self._lock:
+            now = time.time()
+            weight = self._weight(now)
+            self._scores = {
+                _id: score / weight
+                for _id, score in self._scores.items()
+                if score / weight >= self.min_score
+            }
+            self._epoch = now
+            self.ranking = heapq.nlargest(self.size, self._scores, key=self._scores.__getitem__)
+            self.snapshot_time = now
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"生成预设热度排行失败: {e}")
+
+    def start(self):
+        """启动后台快照任务 (应用启动时调用)"""
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self._scores),
+            "ranking_size": len(self.ranking),
+            "snapshot_time": self.snapshot_time,
+        }
+
+
+trending_tracker = TrendingTracker(
+    half_life=config.TRENDING_HALF_LIFE,
+    size=config.TRENDING_SIZE,
+    min_score=config.TRENDING_MIN_SCORE,
+    interval=config.TRENDING_SNAPSHOT_INTERVAL,
+)
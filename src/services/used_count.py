@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+from typing import Dict, Optional
+
+from src.conf import config
+from src.log import logger
+from src.models.preset import DBPreset
+from src.utils.db import run_db
+
+
+class UsedCountBuffer:
+    """预设使用次数写合并缓冲区
+
+    使用次数先在内存中按预设 id 累加，由后台任务每隔 flush_interval 秒
+    (或累计增量达到 flush_threshold 时) 批量写回数据库，避免热门预设的行锁争用；
+    写回失败的增量会并回缓冲区等待下次写回，应用关闭时写回剩余增量
+    """
+
+    def __init__(self, flush_interval: float, flush_threshold: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending: Dict[str, int] = {}
+        self._pending_total = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.flushed = 0
+        self.flush_failures = 0
+
+    def add(self, _id: str, increment: int = 1):
+        """记录一次使用 (仅在事件循环中调用)"""
+
+        self._pending[_id] = self._pending.get(_id, 0) + increment
+        self._pending_total += increment
+        if self._pending_total >= self.flush_threshold and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _drain(self) -> Dict[str, int]:
+        pending, self._pending, self._pending_total = self._pending, {}, 0
+        return pending
+
+    def _restore(self, pending: Dict[str, int]):
+        for _id, increment in pending.items():
+            self._pending[_id] = self._pending.get(_id, 0) + increment
+            self._pending_total += increment
+
+    async def flush(self):
+        """将缓冲区中的增量写回数据库"""
+
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            pending = self._drain()
+            if not pending:
+                return
+            try:
+                await run_db(DBPreset.increase_used_counts, pending)
+            except Exception as e:
+                self.flush_failures += 1
+                self._restore(pending)
+                logger.error(f"写回预设使用次数失败 ({len(pending)} 个预设): {e}")
+            else:
+                self.flushed += sum(pending.values())
+
+    async def _run(self):
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)  # type: ignore
+            self._wakeup.clear()  # type: ignore
+            await self.flush()
+
+    def start(self):
+        """启动后台写回任务 (应用启动时调用)"""
+
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台写回任务并写回剩余增量 (应用关闭时调用)"""
+
+        if self._task is not None:
+            # 等待进行中的写回完成后再取消，避免已取出的增量丢失
+            async with self._flush_lock:  # type: ignore
+                self._task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await self._task
+            self._task = None
+        await self.flush()
+        self._wakeup = None
+        self._flush_lock = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_presets": len(self._pending),
+            "pending_increments": self._pending_total,
+            "flushed_increments": self.flushed,
+            "flush_failures": self.flush_failures,
+        }
+
+
+used_count_buffer = UsedCountBuffer(
+    flush_interval=config.USED_COUNT_FLUSH_INTERVAL,
+    flush_threshold=config.USED_COUNT_FLUSH_THRESHOLD,
+)
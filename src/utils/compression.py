@@ -0,0 +1,222 @@
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf import config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+# 服务端偏好顺序 (客户端权重相同时优先选择靠前的编码)
+ENCODINGS: List[str] = [
+    name
+    for name, available in (("br", brotli), ("zstd", zstandard), ("gzip", zlib))
+    if available is not None
+]
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+
+
+class _Compressor:
+    """统一各压缩库的流式压缩接口"""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=config.BROTLI_QUALITY)
+            self.compress, self.flush = self._obj.process, self._obj.finish
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=config.ZSTD_LEVEL).compressobj()
+            self.compress, self.flush = self._obj.compress, self._obj.flush
+        else:
+            self._obj = zlib.compressobj(config.GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self.flush = self._obj.compress, self._obj.flush
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compressor = _Compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """根据 Accept-Encoding 请求头选择可用的内容编码，不压缩时返回 None"""
+
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for name in ENCODINGS:
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class EncodedBody:
+    """编码后的响应体，各压缩版本在首次使用时生成并随之缓存"""
+
+    __slots__ = ("_variants", "raw")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._variants: Dict[str, bytes] = {}
+
+    def get(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.raw
+        variant = self._variants.get(encoding)
+        if variant is None:
+            variant = self._variants[encoding] = compress(self.raw, encoding)
+        return variant
+
+
+def response_encoding(request: Request, body: EncodedBody) -> Optional[str]:
+    """响应体将使用的内容编码 (过小的响应体不压缩)"""
+
+    if len(body.raw) < config.COMPRESSION_MINIMUM_SIZE:
+        return None
+    return negotiate(request.headers.get("Accept-Encoding"))
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """为 ETag 附加编码后缀以区分各压缩版本"""
+
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+
+def encoded_response(
+    request: Request,
+    body: EncodedBody,
+    media_type: str = "application/json",
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """按请求协商的内容编码返回 (缓存的) 响应体
+
+    压缩版本由 body 缓存，不再经过压缩中间件；headers 中的 ETag 会附加编码后缀以区分各版本
+    """
+
+    headers = dict(headers or {})
+    encoding = response_encoding(request, body)
+    headers["Vary"] = "Accept-Encoding"
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        if "ETag" in headers:
+            headers["ETag"] = encoded_etag(headers["ETag"], encoding)
+    return Response(content=body.get(encoding), media_type=media_type, headers=headers)
+
+
+class CompressionMiddleware:
+    """响应压缩中间件: 按 Accept-Encoding 协商 br / zstd / gzip (视可用的压缩库而定)
+
+    小于 minimum_size 的响应、非文本类响应与已设置 Content-Encoding 的响应不做处理，
+    流式响应逐块压缩
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("Accept-Encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None  # type: ignore
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or not is_compressible(
+                headers.get("content-type", ""),
+            )
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.passthrough:
+            await self._send_start()
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self._send_start()
+                await self.send(message)
+                return
+            self.compressor = _Compressor(self.encoding)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.compressor.compress(body) + self.compressor.flush()
+                headers["Content-Length"] = str(len(body))
+                await self._send_start()
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self._send_start()
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.flush()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_start(self):
+        if self.start_message is not None:
+            await self.send(self.start_message)
+            self.start_message = None
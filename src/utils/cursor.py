@@ -0,0 +1,42 @@
+import base64
+from datetime import datetime
+from typing import Any, List
+
+import ujson
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _load_value(value: Any, python_type: type) -> Any:
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(*values: Any) -> str:
+    """将排序键编码为不透明的游标字符串"""
+
+    raw = ujson.dumps([_dump_value(value) for value in values], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, *python_types: type) -> List[Any]:
+    """解码游标字符串，并按 python_types 还原各个排序键的类型"""
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = ujson.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != len(python_types):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    try:
+        return [_load_value(value, t) for value, t in zip(values, python_types)]
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
@@ -1,40 +1,366 @@
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, TypeVar
+
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+from starlette.concurrency import run_in_threadpool
+from typing_extensions import Self
 
 from src.conf import config
 from src.log import logger
 
+T = TypeVar("T")
+
 # Create Database Connection:
 Base = declarative_base()
 
-# Init Database engine:
-engine = create_engine(config.DATABASE_URL, pool_pre_ping=True)
+
+def _pool_options(url: str) -> Dict[str, Any]:
+    """生成连接池参数 (内存 SQLite 数据库使用 SQLAlchemy 默认的连接池策略)"""
+
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+    }
+
+
+class PoolStats:
+    """连接池使用统计，用于评估连接池大小"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "timeouts": self.timeouts,
+                "wait_count": self.wait_count,
+                "avg_wait_ms": (
+                    self.total_wait / self.wait_count * 1000 if self.wait_count else 0.0
+                ),
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+pool_stats = PoolStats()
+
+# Init Database engine (进程内唯一的 engine，所有会话共享同一个连接池):
+engine = create_engine(
+    config.DATABASE_URL,
+    pool_pre_ping=True,
+    **_pool_options(config.DATABASE_URL),
+)
+
+# 共享的会话工厂 (提交后不过期对象属性，便于在会话关闭后继续读取)
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+# 会话作用域: 工作单元 (请求) 内为其独有的作用域 id，其余情况按线程隔离
+_session_scope: ContextVar[Optional[int]] = ContextVar("db_session_scope", default=None)
+_scope_counter = itertools.count(1)
+
+
+def current_session_scope() -> Any:
+    """获取当前会话作用域标识"""
+
+    scope = _session_scope.get()
+    return scope if scope is not None else f"thread-{threading.get_ident()}"
+
+
+# 按作用域隔离的会话注册表，并发请求之间不会共享同一个 Session
+db_registry = scoped_session(SessionLocal, scopefunc=current_session_scope)
+
+
+# 异步数据库引擎 (仅在 DATABASE_ASYNC 开启时创建，同步 engine 仍用于建表等启动任务)
+async_engine = (
+    create_async_engine(
+        config.ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        **_pool_options(config.ASYNC_DATABASE_URL),
+    )
+    if config.DATABASE_ASYNC
+    else None
+)
+AsyncSessionLocal = (
+    async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    if async_engine is not None
+    else None
+)
+
+
+def _track_pool(target: Engine):
+    """注册连接池事件，统计连接建立、取出与归还次数"""
+
+    @event.listens_for(target, "connect")
+    def _on_connect(_dbapi_connection, _connection_record):
+        pool_stats.incr("connects")
+
+    @event.listens_for(target, "checkout")
+    def _on_checkout(_dbapi_connection, _connection_record, _connection_proxy):
+        pool_stats.incr("checkouts")
+
+    @event.listens_for(target, "checkin")
+    def _on_checkin(_dbapi_connection, _connection_record):
+        pool_stats.incr("checkins")
+
+
+_track_pool(async_engine.sync_engine if async_engine is not None else engine)
+
 Base.metadata.create_all(engine)
 
 
+def get_pool_stats() -> Dict[str, Any]:
+    """获取连接池当前状态与累计统计"""
+
+    pool = async_engine.pool if async_engine is not None else engine.pool
+    status: Dict[str, Any] = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    status.update(pool_stats.snapshot())
+    return status
+
+
+def _checkout(db: Session):
+    """立即从连接池取出连接，以统计等待耗时"""
+
+    start = time.perf_counter()
+    try:
+        db.connection()
+    except PoolTimeoutError:
+        pool_stats.incr("timeouts")
+        raise
+    pool_stats.record_wait(time.perf_counter() - start)
+
+
 class connect_db:
     def __enter__(self):
-        self.engine = create_engine(config.DATABASE_URL, pool_pre_ping=True)
-        self.connection = self.engine.connect()
-        if self.connection.invalidated:
-            self.connection.rollback()
-            self.connection = self.engine.connect()
-        self.db: Session = sessionmaker(bind=self.engine)()
+        self.db: Session = SessionLocal()
+        try:
+            _checkout(self.db)
+        except:
+            self.db.close()
+            raise
         return self.db
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type:
             logger.error(f"Error: {exc_type} | {exc_val} | {exc_tb}")
+        self.db.close()
+
+
+def run_after_commit(db: Session, callback: Callable[[], Any]):
+    """在会话当前事务成功提交后执行 callback (回滚时丢弃)，用于在数据落库后清理缓存"""
+
+    db.info.setdefault("after_commit_callbacks", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _on_after_commit(session: Session):
+    for callback in session.info.pop("after_commit_callbacks", []):
+        try:
+            callback()
+        except Exception as e:
+            logger.exception(f"After-commit callback failed: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_after_rollback(session: Session):
+    session.info.pop("after_commit_callbacks", None)
+
+
+def supports_window_functions(db: Session) -> bool:
+    """判断当前数据库是否支持窗口函数 (MySQL 8.0+ / MariaDB 10.2+ / SQLite 3.25+)"""
+
+    dialect = db.get_bind().dialect
+    version = dialect.server_version_info or ()
+    if dialect.name == "mysql":
+        return version >= ((10, 2) if getattr(dialect, "is_mariadb", False) else (8, 0))
+    if dialect.name == "sqlite":
+        return version >= (3, 25)
+    return True
+
+
+@contextmanager
+def session_scope(db: Optional[Session] = None) -> Iterator[Session]:
+    """获取数据库会话
+
+    传入外部会话时直接复用，仅在结束时 flush (提交由会话持有者负责)；
+    否则开启独立会话，并在结束时提交或回滚
+    """
+
+    if db is not None:
+        yield db
+        db.flush()
+        return
+
+    with connect_db() as session:
+        try:
+            yield session
+            session.commit()
+        except:
+            session.rollback()
+            raise
+
+
+# 同步模式下限制同时持有连接的工作单元数量 (不超过连接池容量)，
+# 使等待连接发生在事件循环上，而不是占满线程池导致持有连接的请求无法归还
+_connection_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_connection_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _connection_slots:
+        _connection_slots[loop] = asyncio.Semaphore(
+            config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW,
+        )
+    return _connection_slots[loop]
+
+
+class UnitOfWork:
+    """工作单元: 在同一个会话 (一次连接取出、一个事务) 中执行多个数据库操作
+
+    DATABASE_ASYNC 开启时持有 AsyncSession 并通过 run_sync 在异步驱动上执行，
+    否则持有同步 Session 并在线程池中执行，二者均不会阻塞事件循环；
+    同步会话登记在 db_registry 中，作用域内调用 db_registry() 将得到同一个会话
+    """
+
+    def __init__(self):
+        self._token = _session_scope.set(next(_scope_counter))
+        if AsyncSessionLocal is not None:
+            self.db = AsyncSessionLocal()
         else:
-            self.db.close()
+            self.db = db_registry()
+        self._connected = False
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self.db, AsyncSession)
+
+    async def _connect(self):
+        if self._connected:
+            return
+        self._connected = True
+        if self.is_async:
+            await self.db.run_sync(_checkout)
+            return
+        self._slots = _get_connection_slots()
+        await self._slots.acquire()
+        await run_in_threadpool(_checkout, self.db)
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """执行同步数据库操作 fn(*args, db=<当前会话>, **kwargs)"""
+
+        await self._connect()
+        if self.is_async:
+            return await self.db.run_sync(
+                lambda session: fn(*args, db=session, **kwargs),
+            )
+        return await run_in_threadpool(fn, *args, db=self.db, **kwargs)
+
+    async def commit(self):
+        if not self._connected:
+            return
+        if self.is_async:
+            await self.db.commit()
+        else:
+            await run_in_threadpool(self.db.commit)
+
+    async def rollback(self):
+        if not self._connected:
+            return
+        if self.is_async:
+            await self.db.rollback()
+        else:
+            await run_in_threadpool(self.db.rollback)
+
+    async def close(self):
+        try:
+            if self.is_async:
+                await self.db.close()
+                # 异步模式下作用域内通常没有注册表会话，此时为空操作
+                db_registry.remove()
+            elif self._connected:
+                await run_in_threadpool(db_registry.remove)
+            else:
+                # 未取得连接的会话 (如命中缓存的请求) 关闭时不涉及 I/O，无需切换到线程池
+                db_registry.remove()
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+                self._slots = None
+            if self._token is not None:
+                _session_scope.reset(self._token)
+                self._token = None
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None and self.db.is_active:
+                await self.commit()
+            else:
+                await self.rollback()
+        finally:
+            await self.close()
+
+
+async def get_db() -> AsyncIterator[UnitOfWork]:
+    """FastAPI 依赖: 每个请求共用一个工作单元，请求结束时统一提交或回滚"""
+
+    async with UnitOfWork() as uow:
+        yield uow
+
+
+async def run_db(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在独立的工作单元中执行一次同步数据库操作并提交"""
+
+    async with UnitOfWork() as uow:
+        return await uow.run(fn, *args, **kwargs)
 
 
 logger.info(f"Connected to database {config.DATABASE_URL}")
 
-# Create Database Session:
+# Check Database Connection:
 try:
-    with connect_db() as db:
+    with connect_db():
         pass
 except:
     logger.exception("Failed to create DBSession")
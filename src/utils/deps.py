@@ -7,13 +7,17 @@ from jose import JWTError, jwt
 from src.conf import config
 from src.models.user import DBUser
 from src.schemas.user import TokenData
+from src.utils.db import UnitOfWork, get_db
 
 reuseable_oauth = OAuth2PasswordBearer(tokenUrl="/login", scheme_name="JWT")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 ALGORITHM = "HS256"
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: UnitOfWork = Depends(get_db),
+):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -27,7 +31,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception  # noqa: B904
-    user = DBUser.get_by_username(token_data.username)
+    user = await db.run(DBUser.get_by_username, token_data.username)
     if user is None:
         raise credentials_exception
     return user
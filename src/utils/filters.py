@@ -0,0 +1,91 @@
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import Column, Index
+from sqlalchemy.sql.elements import ColumnElement
+
+from src.schemas.preset import FilterOption
+
+# 点查询类操作 (可作为组合索引的前导列继续向后匹配)
+POINT_OPS = ("eq", "in")
+MAX_IN_VALUES = 100
+
+
+def _coerce(column: Column, value: Any) -> Any:
+    """将筛选值转换为列对应的 Python 类型"""
+
+    python_type = column.type.python_type
+    try:
+        if isinstance(value, python_type):
+            return value
+        if python_type is datetime:
+            return datetime.fromisoformat(str(value))
+        return python_type(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid value for {column.key}: {value}") from e
+
+
+def _compile_one(column: Column, option: FilterOption) -> ColumnElement:
+    op = option.op
+    if op == "eq":
+        if option.value is None:
+            raise ValueError(f"Filter {column.key}: `value` is required")
+        return column == _coerce(column, option.value)
+    if op == "prefix":
+        if not option.value:
+            raise ValueError(f"Filter {column.key}: `value` is required")
+        return column.startswith(str(option.value), autoescape=True)
+    if op == "in":
+        if not option.values or len(option.values) > MAX_IN_VALUES:
+            raise ValueError(
+                f"Filter {column.key}: `values` must contain 1-{MAX_IN_VALUES} items",
+            )
+        return column.in_([_coerce(column, value) for value in option.values])
+    if op == "range":
+        if option.min_value is None and option.max_value is None:
+            raise ValueError(f"Filter {column.key}: `min_value` or `max_value` is required")
+        criteria = []
+        if option.min_value is not None:
+            criteria.append(column >= _coerce(column, option.min_value))
+        if option.max_value is not None:
+            criteria.append(column <= _coerce(column, option.max_value))
+        return criteria[0] if len(criteria) == 1 else criteria[0] & criteria[1]
+    raise ValueError(f"Unsupported filter op: {op}")
+
+
+def _covered_by(index: Index, ops: Dict[str, str]) -> bool:
+    """判断筛选条件能否由该索引的最左前缀完全覆盖 (除最后一列外均需为点查询)"""
+
+    columns = [column.key for column in index.columns][: len(ops)]
+    if set(columns) != set(ops):
+        return False
+    return all(ops[name] in POINT_OPS for name in columns[:-1])
+
+
+def compile_filters(
+    model: Any,
+    filters: Sequence[FilterOption],
+    allowed: Dict[str, Tuple[str, ...]],
+) -> List[ColumnElement]:
+    """将结构化筛选条件编译为 SQL 条件
+
+    仅允许白名单中的字段与操作，且筛选字段组合必须能被模型上声明的某个索引覆盖，
+    避免单个请求触发全表扫描
+    """
+
+    ops: Dict[str, str] = {}
+    criteria: List[ColumnElement] = []
+    for option in filters:
+        name = option.field_name
+        if name not in allowed:
+            raise ValueError(f"Filtering on `{name}` is not supported")
+        if option.op not in allowed[name]:
+            raise ValueError(f"Filter op `{option.op}` is not supported on `{name}`")
+        if name in ops:
+            raise ValueError(f"Duplicate filter on `{name}`")
+        ops[name] = option.op
+        criteria.append(_compile_one(getattr(model, name), option))
+
+    if ops and not any(_covered_by(index, ops) for index in model.__table__.indexes):
+        raise ValueError(f"No index supports filtering on {sorted(ops)}")
+    return criteria
@@ -0,0 +1,35 @@
+from typing import Any, AsyncIterator, Tuple
+
+from src.utils.response import dumps
+
+
+def dump_line(obj: Any) -> bytes:
+    """将对象编码为一行 NDJSON"""
+
+    return dumps(obj) + b"\n"
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_size: int,
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """从字节流中逐行读取 NDJSON，返回 (行号, 行内容)，跳过空行
+
+    任意一行 (包括尚未读完的行) 超过 max_line_size 字节时抛出 ValueError
+    """
+
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if len(line) > max_line_size:
+                raise ValueError(f"Line {line_no} exceeds {max_line_size} bytes")
+            if line.strip():
+                yield line_no, line
+        if len(buffer) > max_line_size:
+            raise ValueError(f"Line {line_no + 1} exceeds {max_line_size} bytes")
+    if buffer.strip():
+        yield line_no + 1, buffer
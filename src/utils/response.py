@@ -0,0 +1,34 @@
+from datetime import date, time
+from typing import Any
+
+import ujson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """将对象编码为 UTF-8 JSON (安装 orjson 时使用 orjson，否则使用 ujson)"""
+
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return ujson.dumps(content, ensure_ascii=False, default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON 响应: 原生支持 datetime 等类型，直接编码而不经过 jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
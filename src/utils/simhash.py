@@ -0,0 +1,187 @@
+import re
+import threading
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+FINGERPRINT_BITS = 64
+BANDS = 4  # 指纹分段数，海明距离小于分段数的两个指纹至少有一段完全相同
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+_BAND_MASK = (1 << BAND_BITS) - 1
+_IGNORED = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """统一全半角与大小写，并去除空白与标点"""
+
+    return _IGNORED.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+# _BIT_TABLES[b]: 将字节映射为其第 b 位的值，用于按位统计
+_BIT_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+
+
+def simhash(text: str, shingle_size: int = 4) -> int:
+    """计算文本的 64 位 SimHash 指纹
+
+    使用规范化文本的字符 n-gram 作为特征，各位的统计通过字节串切片与 translate 完成，
+    避免逐特征逐位的 Python 循环。指纹仅在当前进程内可比较 (依赖 Python 内置哈希)
+    """
+
+    text = normalize(text)
+    if len(text) <= shingle_size:
+        shingles = {text}
+    else:
+        shingles = {text[i : i + shingle_size] for i in range(len(text) - shingle_size + 1)}
+    raw = array("q", list(map(hash, shingles))).tobytes()
+
+    # 统计各位上为 1 的特征数，超过半数的位记为 1
+    threshold = len(shingles) / 2
+    fingerprint = 0
+    for byte in range(8):
+        column = raw[byte::8]
+        for bit in range(8):
+            if column.translate(_BIT_TABLES[bit]).count(1) > threshold:
+                fingerprint |= 1 << (byte * 8 + bit)
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _bands(fingerprint: int) -> List[int]:
+    return [(fingerprint >> (BAND_BITS * i)) & _BAND_MASK for i in range(BANDS)]
+
+
+class SimHashIndex:
+    """SimHash 近似重复索引 (线程安全)
+
+    每个指纹按 16 位分为 4 段登记在对应分段的桶中，查询时只比较至少一段相同的候选，
+    可找出海明距离不超过 max_distance (< 4) 的全部指纹；
+    每个条目仅保存 id 与一个整数指纹，内存占用与条目数成正比
+
+    构建完成前删除的条目会被记录，构建结束后再次移除，避免被构建时读取的旧数据重新加入
+    """
+
+    def __init__(self, max_distance: int = 3):
+        if max_distance >= BANDS:
+            raise ValueError(f"max_distance must be less than {BANDS}")
+        self.max_distance = max_distance
+        self.ready = False
+        self._fingerprints: Dict[str, int] = {}
+        self._buckets: List[Dict[int, List[str]]] = [{} for _ in range(BANDS)]
+        self._pending_removals: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _remove(self, _id: str):
+        fingerprint = self._fingerprints.pop(_id, None)
+        if fingerprint is None:
+            return
+        for buckets, band in zip(self._buckets, _bands(fingerprint)):
+            bucket = buckets[band]
+            bucket.remove(_id)
+            if not bucket:
+                del buckets[band]
+
+    def _add(self, _id: str, fingerprint: int):
+        self._fingerprints[_id] = fingerprint
+        for buckets, band in zip(self._buckets, _bands(fingerprint)):
+            buckets.setdefault(band, []).append(_id)
+
+    def add(self, _id: str, text: str):
+        fingerprint = simhash(text)
+        with self._lock:
+            self._remove(_id)
+            self._add(_id, fingerprint)
+
+    def remove(self, _id: str):
+        with self._lock:
+            self._remove(_id)
+            if not self.ready:
+                self._pending_removals.add(_id)
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        for _id, text in items:
+            self.add(_id, text)
+
+    def build(self, items: Iterable[Tuple[str, str]]):
+        """从 (id, 文本) 序列构建索引，完成后标记为就绪
+
+        构建期间已由 add 加入的条目 (更新) 比读取的数据新，不再覆盖；
+        构建期间删除的条目在构建结束后移除
+        """
+
+        for _id, text in items:
+            fingerprint = simhash(text)
+            with self._lock:
+                if _id not in self._fingerprints and _id not in self._pending_removals:
+                    self._add(_id, fingerprint)
+        with self._lock:
+            for _id in self._pending_removals:
+                self._remove(_id)
+            self._pending_removals.clear()
+            self.ready = True
+
+    def _candidates(self, fingerprint: int) -> Dict[str, int]:
+        candidates: Dict[str, int] = {}
+        for buckets, band in zip(self._buckets, _bands(fingerprint)):
+            for _id in buckets.get(band, ()):
+                if _id not in candidates:
+                    distance = hamming_distance(fingerprint, self._fingerprints[_id])
+                    if distance <= self.max_distance:
+                        candidates[_id] = distance
+        return candidates
+
+    def find(self, text: str) -> List[Tuple[str, int]]:
+        """查找与文本近似重复的条目，返回按海明距离排序的 (id, 距离)"""
+
+        fingerprint = simhash(text)
+        with self._lock:
+            candidates = self._candidates(fingerprint)
+        return sorted(candidates.items(), key=lambda item: (item[1], item[0]))
+
+    def clusters(self) -> List[List[str]]:
+        """将互为近似重复的条目合并为簇 (并查集)，返回按大小倒序排列的多成员簇"""
+
+        with self._lock:
+            # 指纹相同的条目先合并为一组，再在同一分段桶内比较不同的指纹
+            groups: Dict[int, List[str]] = {}
+            for _id, fingerprint in self._fingerprints.items():
+                groups.setdefault(fingerprint, []).append(_id)
+            parent = {fingerprint: fingerprint for fingerprint in groups}
+
+            def find_root(fingerprint: int) -> int:
+                while parent[fingerprint] != fingerprint:
+                    parent[fingerprint] = parent[parent[fingerprint]]
+                    fingerprint = parent[fingerprint]
+                return fingerprint
+
+            for buckets in self._buckets:
+                for bucket in buckets.values():
+                    fingerprints = list({self._fingerprints[_id] for _id in bucket})
+                    for i, a in enumerate(fingerprints):
+                        for b in fingerprints[i + 1 :]:
+                            if hamming_distance(a, b) <= self.max_distance:
+                                parent[find_root(a)] = find_root(b)
+
+            clusters: Dict[int, List[str]] = {}
+            for fingerprint, ids in groups.items():
+                clusters.setdefault(find_root(fingerprint), []).extend(ids)
+        return sorted(
+            (sorted(ids) for ids in clusters.values() if len(ids) > 1),
+            key=len,
+            reverse=True,
+        )
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._fingerprints),
+                "buckets": sum(len(buckets) for buckets in self._buckets),
+                "ready": self.ready,
+            }
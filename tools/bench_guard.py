@@ -0,0 +1,88 @@
+"""访问频率限制的单次检查耗时基准测试
+
+以模拟时钟按不同的请求频率 (次/分钟) 连续检查同一 IP，对比滑动窗口计数器 (进程内 / 多进程共享表)
+与原先逐条保存时间戳的实现，前者的单次耗时应与请求频率无关
+
+用法: python -m tools.bench_guard [n=20000] [rates=10,100,1000,10000]
+"""
+
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List
+
+CHECK_COUNT: int = 20000
+RATES: List[int] = [10, 100, 1000, 10000]
+
+for arg in sys.argv[1:]:
+    if arg.startswith("n="):
+        CHECK_COUNT = int(arg.split("=")[-1])
+    elif arg.startswith("rates="):
+        RATES = [int(rate) for rate in arg.split("=")[-1].split(",")]
+
+
+def make_timestamp_list_check(limit: int) -> Callable[[float], bool]:
+    """原先的实现: 保存最近 300 秒放行请求的时间戳，每次检查时重建列表并计数"""
+
+    records: List[float] = []
+    banned_until = 0.0
+
+    def check(now: float) -> bool:
+        nonlocal records, banned_until
+        records = [record for record in records if record > now - 300]
+        access_rate = len([record for record in records if record > now - 60])
+        for i in range(2, 8):
+            if access_rate > limit * i:
+                banned_until = now + 60 * i
+                return False
+        if banned_until > now or access_rate > limit:
+            return False
+        records.append(now)
+        return True
+
+    return check
+
+
+def bench(check: Callable[[float], bool], rate: int) -> float:
+    """按每分钟 rate 次的模拟请求频率检查 CHECK_COUNT 次，返回单次检查的平均耗时 (微秒)"""
+
+    interval = 60 / rate
+    now = 1_000_000.0
+    start = time.perf_counter()
+    for _ in range(CHECK_COUNT):
+        check(now)
+        now += interval
+    return (time.perf_counter() - start) / CHECK_COUNT * 1e6
+
+
+def main():
+    from src.conf import config
+    from src.services.guard import AccessGuard, SharedAccessGuard
+
+    limit = config.ACCESS_QPM_LIMIT
+    print(f"ACCESS_QPM_LIMIT: {limit}, checks per rate: {CHECK_COUNT}")
+    print(
+        f"{'rate (req/min)':>15} {'sliding window (us)':>20} "
+        f"{'shared table (us)':>18} {'timestamp list (us)':>20}",
+    )
+    results: Dict[int, float] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for rate in RATES:
+            results[rate] = bench(partial(AccessGuard(max_records=1).check, "127.0.0.1"), rate)
+            shared_guard = SharedAccessGuard(
+                path=Path(directory) / f"guard-{rate}",
+                max_records=1024,
+                max_bans=64,
+            )
+            shared = bench(partial(shared_guard.check, "127.0.0.1"), rate)
+            legacy = bench(make_timestamp_list_check(limit), rate)
+            print(f"{rate:>15} {results[rate]:>20.3f} {shared:>18.3f} {legacy:>20.3f}")
+
+    spread = max(results.values()) / min(results.values())
+    print(f"sliding window max/min cost ratio across rates: {spread:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""数据库迁移工具
+
+用法: poetry run migrate [env=prod] [status|upgrade]
+"""
+
+import sys
+
+
+def main():
+    command = next(
+        (arg for arg in sys.argv[1:] if arg in ("status", "upgrade")),
+        "status",
+    )
+
+    from src.migrations import (
+        applied_versions,
+        load_migrations,
+        metadata,
+        run_migrations,
+    )
+    from src.models import Base, engine
+
+    if command == "upgrade":
+        # 与 database_init 一致: 先创建尚不存在的数据表，迁移只处理已存在的表
+        Base.metadata.create_all(engine, checkfirst=True)
+        done = run_migrations(engine)
+        print(f"已执行迁移: {done}" if done else "数据库已是最新版本")
+        return
+
+    metadata.create_all(engine, checkfirst=True)
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+    for version, module in load_migrations().items():
+        state = "applied" if version in applied else "pending"
+        print(f"{version:04d} [{state}] {module.DESCRIPTION}")
+
+
+if __name__ == "__main__":
+    main()
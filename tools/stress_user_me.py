@@ -0,0 +1,159 @@
+"""并发压测 `/user/me`，检查并发请求之间不会共享数据库会话
+
+用法: python -m tools.stress_user_me [env=dev] [n=2000] [concurrency=500]
+"""
+
+import asyncio
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+REQUEST_COUNT: int = 2000
+CONCURRENCY: int = 500
+STRESS_USERNAME: str = "__stress_user__"
+
+for arg in sys.argv[1:]:
+    if arg.startswith("n="):
+        REQUEST_COUNT = int(arg.split("=")[-1])
+    elif arg.startswith("concurrency="):
+        CONCURRENCY = int(arg.split("=")[-1])
+
+
+async def asgi_get(app, path: str, headers: Dict[str, str]) -> Tuple[int, bytes]:
+    """直接以 ASGI 协议调用应用，避免引入额外的 HTTP 客户端依赖"""
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    status = 0
+    body = b""
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, body
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status, body
+
+
+def main():
+    from src.app import app
+    from src.models.user import DBUser
+    from src.utils.auth import create_access_token
+    from src.utils.db import (
+        AsyncSessionLocal,
+        current_session_scope,
+        db_registry,
+        run_db,
+    )
+
+    # 记录每次查询所处的作用域与所用的会话 (保留会话引用，避免对象 id 被复用)
+    usages: List[Tuple[object, object, bool]] = []
+    usages_lock = threading.Lock()
+    original_get_by_username = DBUser.get_by_username.__func__  # type: ignore
+
+    def recording_get_by_username(cls, username, db=None):
+        scope = current_session_scope()
+        # 同步模式下作用域内的注册表会话必须与工作单元传入的会话一致
+        consistent = (
+            db is None
+            or AsyncSessionLocal is not None
+            or not isinstance(scope, int)
+            or db_registry() is db
+        )
+        with usages_lock:
+            usages.append((scope, db, consistent))
+        return original_get_by_username(cls, username, db=db)
+
+    DBUser.get_by_username = classmethod(recording_get_by_username)  # type: ignore
+
+    async def prepare_user():
+        user = await run_db(DBUser.get_by_username, STRESS_USERNAME)
+        if user is None:
+            await run_db(
+                DBUser.add,
+                DBUser(
+                    username=STRESS_USERNAME,
+                    password="-",
+                    perm_level=0,
+                    login_time=datetime.now(),
+                ),
+            )
+        else:
+            await run_db(DBUser.update, user, login_time=datetime.now())
+
+    async def run():
+        await prepare_user()
+        try:
+            usages.clear()
+            token = create_access_token(STRESS_USERNAME)
+            semaphore = asyncio.Semaphore(CONCURRENCY)
+
+            async def one(i: int):
+                headers = {
+                    "Authorization": f"Bearer {token}",
+                    # 每个请求使用不同的来源 IP，避免触发访问频率限制
+                    "X-Forwarded-For": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+                }
+                async with semaphore:
+                    return await asgi_get(app, "/user/me", headers)
+
+            start = asyncio.get_running_loop().time()
+            results = await asyncio.gather(*(one(i) for i in range(REQUEST_COUNT)))
+            return results, asyncio.get_running_loop().time() - start
+        finally:
+            # 压测用户仅供本次压测使用，结束后删除
+            await run_db(DBUser.delete, DBUser(username=STRESS_USERNAME))
+
+    results, elapsed = asyncio.run(run())
+
+    failed = [r for r in results if r[0] != 200 or STRESS_USERNAME.encode() not in r[1]]
+    scopes = {scope for scope, _, _ in usages}
+    sessions = {id(db) for _, db, _ in usages}
+    inconsistent = [u for u in usages if not u[2]]
+
+    print(f"requests: {REQUEST_COUNT}, concurrency: {CONCURRENCY}, elapsed: {elapsed:.2f}s")
+    print(f"failed responses: {len(failed)}")
+    print(f"distinct scopes: {len(scopes)}, distinct sessions: {len(sessions)}")
+    print(f"registry/session mismatches: {len(inconsistent)}")
+
+    ok = (
+        not failed
+        and len(usages) == REQUEST_COUNT
+        and len(scopes) == REQUEST_COUNT
+        and len(sessions) == REQUEST_COUNT
+        and not inconsistent
+    )
+    print("PASS: no session shared between concurrent requests" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()